@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+低码率优先的自适应转写
+1) 下载并转写低码率音频（playUrlLow）
+2) 按 avg_logprob / no_speech_prob 挑出低置信度片段，合并成时间区间
+3) 解析高码率 m4a（playUrlHigh）的 moov 样本表，只用 HTTP Range 拉取这些区间对应的 AAC 帧，
+   封装为 ADTS 后重新转写，替换原片段
+4) 汇报节省的字节数与置信度变化
+"""
+
+import os
+import json
+import struct
+import argparse
+import tempfile
+from typing import List, Dict, Any, Optional, Tuple
+
+import requests
+
+# 首次探测读取的字节数（faststart 的 m4a 中 moov 通常位于文件开头）
+PROBE_BYTES = 64 * 1024
+# 相邻样本字节间隔小于该值时合并为同一个 Range 请求
+RANGE_MERGE_GAP = 4 * 1024
+# 高码率转写首尾与被替换跨度相差不超过该秒数时视为覆盖了该跨度
+COVER_TOLERANCE = 1.0
+
+
+class RangeNotSupportedError(Exception):
+    """服务端不支持 Range 请求"""
+
+
+class Mp4ParseError(Exception):
+    """m4a 结构无法解析（非 AAC 音轨、缺少样本表等）"""
+
+
+def fetch_range(session: requests.Session, url: str, start: int, end: int) -> Tuple[bytes, int]:
+    """
+    拉取 [start, end] 字节区间
+
+    Returns:
+        (数据, 文件总大小)
+    """
+    response = session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=30, verify=False)
+    try:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RangeNotSupportedError(f"服务端返回 {response.status_code}，不支持 Range 请求")
+        content_range = response.headers.get("Content-Range", "")
+        total = int(content_range.rsplit("/", 1)[-1]) if "/" in content_range else 0
+        return response.content, total
+    finally:
+        response.close()
+
+
+def fetch_total_size(session: requests.Session, url: str) -> Tuple[int, int]:
+    """
+    获取文件总大小：优先 HEAD 的 Content-Length，拿不到时拉取 1 字节的 Range
+
+    Returns:
+        (文件总大小, 已拉取字节数)
+    """
+    response = session.head(url, allow_redirects=True, timeout=30, verify=False)
+    try:
+        response.raise_for_status()
+        total = int(response.headers.get("Content-Length") or 0)
+    finally:
+        response.close()
+    if total:
+        return total, 0
+    data, total = fetch_range(session, url, 0, 0)
+    return total, len(data)
+
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """
+    遍历 data[start:end] 中的 box，产出 (类型, 内容起点, 内容终点)
+    """
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            break
+        yield box_type, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _find_box(data: bytes, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for t, s, e in _iter_boxes(data, start, end):
+        if t == box_type:
+            return s, e
+    return None
+
+
+def _read_descriptor_length(data: bytes, pos: int) -> Tuple[int, int]:
+    length = 0
+    for _ in range(4):
+        b = data[pos]
+        pos += 1
+        length = (length << 7) | (b & 0x7F)
+        if not b & 0x80:
+            break
+    return length, pos
+
+
+def _parse_audio_specific_config(esds: bytes) -> Tuple[int, int, int]:
+    """
+    从 esds 中解析 AudioSpecificConfig
+
+    Returns:
+        (audioObjectType, 采样率索引, 声道配置)
+    """
+    pos = 4  # version + flags
+    if esds[pos] != 0x03:
+        raise Mp4ParseError("esds 缺少 ES_Descriptor")
+    _, pos = _read_descriptor_length(esds, pos + 1)
+    flags = esds[pos + 2]
+    pos += 3
+    if flags & 0x80:
+        pos += 2
+    if flags & 0x40:
+        pos += 1 + esds[pos]
+    if flags & 0x20:
+        pos += 2
+    if esds[pos] != 0x04:
+        raise Mp4ParseError("esds 缺少 DecoderConfigDescriptor")
+    _, pos = _read_descriptor_length(esds, pos + 1)
+    pos += 13
+    if esds[pos] != 0x05:
+        raise Mp4ParseError("esds 缺少 DecoderSpecificInfo")
+    _, pos = _read_descriptor_length(esds, pos + 1)
+
+    bits = int.from_bytes(esds[pos:pos + 5].ljust(5, b"\0"), "big")
+    total_bits = 40
+
+    def take(n: int) -> int:
+        nonlocal total_bits
+        total_bits -= n
+        return (bits >> total_bits) & ((1 << n) - 1)
+
+    object_type = take(5)
+    freq_index = take(4)
+    if freq_index == 15:
+        raise Mp4ParseError("不支持显式采样率的 AudioSpecificConfig")
+    channel_config = take(4)
+    if object_type in (5, 29):
+        # HE-AAC：ADTS 中使用核心层 AAC-LC 的参数（保留上面的核心采样率），由解码器隐式还原 SBR/PS
+        if take(4) == 15:
+            raise Mp4ParseError("不支持显式扩展采样率的 AudioSpecificConfig")
+        object_type = take(5)
+    return object_type, freq_index, channel_config
+
+
+def parse_sample_table(moov: bytes) -> Dict[str, Any]:
+    """
+    解析 moov 中第一条音轨的样本表；缺少 box 或数据被截断时统一抛出 Mp4ParseError
+
+    Returns:
+        {"timescale", "offsets", "sizes", "times", "object_type", "freq_index", "channel_config"}
+    """
+    try:
+        return _parse_sample_table(moov)
+    except (KeyError, IndexError, TypeError, ValueError, struct.error) as e:
+        raise Mp4ParseError(f"样本表不完整或已截断: {e!r}") from e
+
+
+def _parse_sample_table(moov: bytes) -> Dict[str, Any]:
+    for t, trak_start, trak_end in _iter_boxes(moov):
+        if t != b"trak":
+            continue
+        mdia = _find_box(moov, trak_start, trak_end, b"mdia")
+        if not mdia:
+            continue
+        hdlr = _find_box(moov, mdia[0], mdia[1], b"hdlr")
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"soun":
+            continue
+        mdhd = _find_box(moov, mdia[0], mdia[1], b"mdhd")
+        if not mdhd:
+            raise Mp4ParseError("音轨缺少 mdhd")
+        version = moov[mdhd[0]]
+        timescale_pos = mdhd[0] + (20 if version == 1 else 12)
+        timescale = struct.unpack(">I", moov[timescale_pos:timescale_pos + 4])[0]
+
+        minf = _find_box(moov, mdia[0], mdia[1], b"minf")
+        stbl = _find_box(moov, minf[0], minf[1], b"stbl") if minf else None
+        if not stbl:
+            raise Mp4ParseError("音轨缺少 stbl")
+        boxes = {bt: (s, e) for bt, s, e in _iter_boxes(moov, stbl[0], stbl[1])}
+        missing = [bt.decode() for bt in (b"stsd", b"stsz", b"stsc", b"stts") if bt not in boxes]
+        if b"stco" not in boxes and b"co64" not in boxes:
+            missing.append("stco/co64")
+        if missing:
+            raise Mp4ParseError(f"stbl 缺少 {', '.join(missing)}")
+
+        # stsd → mp4a → esds
+        stsd_start, _ = boxes[b"stsd"]
+        entry_type = moov[stsd_start + 12:stsd_start + 16]
+        if entry_type != b"mp4a":
+            raise Mp4ParseError(f"不支持的音频编码: {entry_type!r}")
+        entry_start = stsd_start + 16
+        sound_version = struct.unpack(">H", moov[entry_start + 8:entry_start + 10])[0]
+        children_start = entry_start + 28 + {1: 16, 2: 36}.get(sound_version, 0)
+        entry_size = struct.unpack(">I", moov[stsd_start + 8:stsd_start + 12])[0]
+        esds = _find_box(moov, children_start, stsd_start + 8 + entry_size, b"esds")
+        if not esds:
+            raise Mp4ParseError("mp4a 缺少 esds")
+        object_type, freq_index, channel_config = _parse_audio_specific_config(moov[esds[0]:esds[1]])
+
+        # stsz
+        s, _ = boxes[b"stsz"]
+        sample_size, sample_count = struct.unpack(">II", moov[s + 4:s + 12])
+        if sample_size:
+            sizes = [sample_size] * sample_count
+        else:
+            sizes = list(struct.unpack(f">{sample_count}I", moov[s + 12:s + 12 + 4 * sample_count]))
+
+        # stco / co64
+        if b"stco" in boxes:
+            s, _ = boxes[b"stco"]
+            n = struct.unpack(">I", moov[s + 4:s + 8])[0]
+            chunk_offsets = struct.unpack(f">{n}I", moov[s + 8:s + 8 + 4 * n])
+        else:
+            s, _ = boxes[b"co64"]
+            n = struct.unpack(">I", moov[s + 4:s + 8])[0]
+            chunk_offsets = struct.unpack(f">{n}Q", moov[s + 8:s + 8 + 8 * n])
+
+        # stsc：展开每个 chunk 的样本数
+        s, _ = boxes[b"stsc"]
+        n = struct.unpack(">I", moov[s + 4:s + 8])[0]
+        stsc = [struct.unpack(">III", moov[s + 8 + 12 * i:s + 20 + 12 * i]) for i in range(n)]
+        offsets: List[int] = []
+        sample_index = 0
+        for i, (first_chunk, samples_per_chunk, _) in enumerate(stsc):
+            last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+            for chunk in range(first_chunk, last_chunk + 1):
+                offset = chunk_offsets[chunk - 1]
+                for _ in range(samples_per_chunk):
+                    if sample_index >= sample_count:
+                        break
+                    offsets.append(offset)
+                    offset += sizes[sample_index]
+                    sample_index += 1
+
+        # stts：样本解码时间
+        s, _ = boxes[b"stts"]
+        n = struct.unpack(">I", moov[s + 4:s + 8])[0]
+        times: List[int] = []
+        current = 0
+        for i in range(n):
+            count, delta = struct.unpack(">II", moov[s + 8 + 8 * i:s + 16 + 8 * i])
+            for _ in range(count):
+                times.append(current)
+                current += delta
+
+        return {
+            "timescale": timescale,
+            "offsets": offsets,
+            "sizes": sizes[:len(offsets)],
+            "times": times[:len(offsets)],
+            "object_type": object_type,
+            "freq_index": freq_index,
+            "channel_config": channel_config,
+        }
+    raise Mp4ParseError("未找到音轨")
+
+
+def fetch_moov(session: requests.Session, url: str) -> Tuple[bytes, int, int]:
+    """
+    定位并拉取 moov box
+
+    Returns:
+        (moov 内容, 文件总大小, 已拉取字节数)
+    """
+    head, total = fetch_range(session, url, 0, PROBE_BYTES - 1)
+    fetched = len(head)
+    pos = 0
+    while pos < total:
+        if pos + 16 > len(head):
+            # 当前 box 头不在已拉取的数据中，单独探测
+            probe, _ = fetch_range(session, url, pos, pos + 15)
+            fetched += len(probe)
+            head_view, base = probe, pos
+        else:
+            head_view, base = head, 0
+        rel = pos - base
+        if rel + 8 > len(head_view):
+            raise Mp4ParseError("m4a 数据被截断，无法读取 box 头")
+        size, box_type = struct.unpack(">I4s", head_view[rel:rel + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", head_view[rel + 8:rel + 16])[0]
+            header = 16
+        elif size == 0:
+            size = total - pos
+        if size < header:
+            break
+        if box_type == b"moov":
+            if pos + size <= len(head):
+                return head[pos + header:pos + size], total, fetched
+            data, _ = fetch_range(session, url, pos + header, pos + size - 1)
+            return data, total, fetched + len(data)
+        pos += size
+    raise Mp4ParseError("未找到 moov")
+
+
+def adts_header(object_type: int, freq_index: int, channel_config: int, payload_size: int) -> bytes:
+    frame_length = payload_size + 7
+    profile = (object_type - 1) & 0x3
+    return bytes([
+        0xFF,
+        0xF1,
+        (profile << 6) | ((freq_index & 0xF) << 2) | ((channel_config >> 2) & 0x1),
+        ((channel_config & 0x3) << 6) | ((frame_length >> 11) & 0x3),
+        (frame_length >> 3) & 0xFF,
+        ((frame_length & 0x7) << 5) | 0x1F,
+        0xFC,
+    ])
+
+
+def fetch_time_range_as_adts(session: requests.Session, url: str, table: Dict[str, Any],
+                             start: float, end: float, output_path: str) -> Tuple[float, int]:
+    """
+    只拉取 [start, end) 秒对应的 AAC 帧，写成 ADTS 文件
+
+    Returns:
+        (片段实际起始秒数, 拉取字节数)
+    """
+    timescale = table["timescale"]
+    begin_ts, end_ts = start * timescale, end * timescale
+    indices = [i for i, t in enumerate(table["times"]) if begin_ts <= t < end_ts]
+    if not indices:
+        return start, 0
+
+    # 合并相邻样本为尽量少的 Range 请求
+    ranges: List[List[int]] = []
+    for i in indices:
+        s, e = table["offsets"][i], table["offsets"][i] + table["sizes"][i]
+        if ranges and s - ranges[-1][1] <= RANGE_MERGE_GAP:
+            ranges[-1][1] = max(ranges[-1][1], e)
+        else:
+            ranges.append([s, e])
+
+    fetched = 0
+    blobs: List[Tuple[int, bytes]] = []
+    for s, e in ranges:
+        data, _ = fetch_range(session, url, s, e - 1)
+        fetched += len(data)
+        blobs.append((s, data))
+
+    with open(output_path, "wb") as f:
+        for i in indices:
+            offset, size = table["offsets"][i], table["sizes"][i]
+            for base, data in blobs:
+                if base <= offset and offset + size <= base + len(data):
+                    frame = data[offset - base:offset - base + size]
+                    break
+            else:
+                continue
+            f.write(adts_header(table["object_type"], table["freq_index"], table["channel_config"], size))
+            f.write(frame)
+    return table["times"][indices[0]] / timescale, fetched
+
+
+def select_low_confidence_ranges(segments: List[Dict[str, Any]], logprob_threshold: float = -1.0,
+                                 no_speech_threshold: float = 0.6, padding: float = 1.0,
+                                 merge_gap: float = 3.0) -> List[Tuple[float, float]]:
+    """
+    挑出低置信度片段并合并为时间区间（两侧各留 padding 秒）
+    """
+    ranges: List[List[float]] = []
+    for seg in segments:
+        if seg.get("avg_logprob", 0) >= logprob_threshold and seg.get("no_speech_prob", 0) <= no_speech_threshold:
+            continue
+        start = max(0.0, seg["start"] - padding)
+        end = seg["end"] + padding
+        if ranges and start - ranges[-1][1] <= merge_gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return [(s, e) for s, e in ranges]
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def _update_saved_bytes(stats: Dict[str, Any]) -> None:
+    """
+    相比整段下载高码率节省的字节数；高码率总大小未知时记为 0
+    """
+    if stats["high_total_bytes"]:
+        stats["saved_bytes"] = stats["high_total_bytes"] - stats["low_bytes"] - stats["high_fetched_bytes"]
+
+
+def refine_with_high_quality(low_result: Dict[str, Any], low_audio_path: str, high_url: str,
+                             model_name: str = "base", logprob_threshold: float = -1.0,
+                             no_speech_threshold: float = 0.6) -> Dict[str, Any]:
+    """
+    用高码率流的局部片段重新转写低置信度区间，返回合并后的结果（附 adaptive_stats）
+
+    Args:
+        low_result: 低码率音频的 Whisper 结果
+        low_audio_path: 低码率音频路径（用于统计字节数）
+        high_url: 高码率播放链接
+        model_name: Whisper模型名称
+        logprob_threshold: 平均对数概率低于该值视为低置信度
+        no_speech_threshold: 无语音概率高于该值视为可疑
+    """
+    segments = low_result.get("segments", [])
+    ranges = select_low_confidence_ranges(segments, logprob_threshold, no_speech_threshold)
+    stats: Dict[str, Any] = {
+        "low_bytes": os.path.getsize(low_audio_path) if os.path.exists(low_audio_path) else 0,
+        "high_total_bytes": 0,
+        "high_fetched_bytes": 0,
+        "saved_bytes": 0,
+        "ranges": len(ranges),
+        "range_seconds": round(sum(e - s for s, e in ranges), 2),
+        "replaced_segments": 0,
+        "rejected_ranges": 0,
+        "failed_ranges": 0,
+    }
+    result = dict(low_result)
+    result["adaptive_stats"] = stats
+    if not high_url:
+        return result
+
+    session = requests.Session()
+    if not ranges:
+        # 没有低置信度片段时不拉取音频数据，只探测高码率总大小用于统计节省量
+        try:
+            stats["high_total_bytes"], stats["high_fetched_bytes"] = fetch_total_size(session, high_url)
+        except (requests.exceptions.RequestException, RangeNotSupportedError, ValueError) as e:
+            print(f"获取高码率文件大小失败: {e}")
+            stats["error"] = str(e)
+        _update_saved_bytes(stats)
+        return result
+
+    from audio2txt2comic.whisper_example import get_or_load_model
+
+    try:
+        moov, total, fetched = fetch_moov(session, high_url)
+        stats["high_total_bytes"] = total
+        stats["high_fetched_bytes"] = fetched
+        table = parse_sample_table(moov)
+    except (requests.exceptions.RequestException, RangeNotSupportedError, Mp4ParseError) as e:
+        print(f"高码率局部拉取不可用，保留低码率结果: {e}")
+        stats["error"] = str(e)
+        _update_saved_bytes(stats)
+        return result
+
+    model = get_or_load_model(model_name)
+    clips: List[Tuple[float, float, List[Dict[str, Any]]]] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, (start, end) in enumerate(ranges):
+            clip_path = os.path.join(tmp_dir, f"clip_{i}.aac")
+            try:
+                clip_start, clip_bytes = fetch_time_range_as_adts(session, high_url, table, start, end, clip_path)
+            except (requests.exceptions.RequestException, RangeNotSupportedError) as e:
+                print(f"拉取区间 {start:.1f}-{end:.1f}s 失败: {e}")
+                stats["failed_ranges"] += 1
+                continue
+            stats["high_fetched_bytes"] += clip_bytes
+            if not clip_bytes:
+                continue
+            try:
+                clip_result = model.transcribe(clip_path, language="zh", condition_on_previous_text=False, verbose=None)
+            except Exception as e:
+                # 片段损坏等导致解码失败时只跳过该区间，保留低码率结果
+                print(f"转写区间 {start:.1f}-{end:.1f}s 失败: {e}")
+                stats["failed_ranges"] += 1
+                continue
+            clip_segments = []
+            for seg in clip_result.get("segments", []):
+                seg = dict(seg)
+                seg["start"] = round(seg["start"] + clip_start, 2)
+                seg["end"] = round(seg["end"] + clip_start, 2)
+                seg["source"] = "high"
+                clip_segments.append(seg)
+            clips.append((start, end, clip_segments))
+
+    # 区间两侧有 padding，高码率转写会带出相邻片段的文本：以片段中点归属区间，
+    # 高码率片段只保留中点落在被替换跨度内的部分，避免文本重复或丢失。
+    # 只有高码率结果覆盖了整个跨度、且平均对数概率不低于原片段时才替换，否则保留低码率片段
+    replaced: List[Dict[str, Any]] = []
+    high_segments: List[Dict[str, Any]] = []
+    replaced_ids = set()
+    for start, end, clip_segments in clips:
+        overlapping = [seg for seg in segments if start <= (seg["start"] + seg["end"]) / 2 <= end]
+        if not overlapping:
+            continue
+        span_start = min(seg["start"] for seg in overlapping)
+        span_end = max(seg["end"] for seg in overlapping)
+        candidates = [seg for seg in clip_segments if span_start <= (seg["start"] + seg["end"]) / 2 <= span_end]
+        covers = (bool(candidates)
+                  and min(seg["start"] for seg in candidates) <= span_start + COVER_TOLERANCE
+                  and max(seg["end"] for seg in candidates) >= span_end - COVER_TOLERANCE)
+        if not covers or _mean([seg.get("avg_logprob", 0) for seg in candidates]) < _mean([seg.get("avg_logprob", 0) for seg in overlapping]):
+            stats["rejected_ranges"] += 1
+            continue
+        for seg in overlapping:
+            replaced_ids.add(id(seg))
+            replaced.append(seg)
+        high_segments.extend(candidates)
+
+    kept = [seg for seg in segments if id(seg) not in replaced_ids]
+    merged = sorted(kept + high_segments, key=lambda s: s["start"])
+    for i, seg in enumerate(merged):
+        seg["id"] = i
+
+    stats["replaced_segments"] = len(replaced)
+    stats["high_segments"] = len(high_segments)
+    _update_saved_bytes(stats)
+    stats["avg_logprob_before"] = _mean([s.get("avg_logprob", 0) for s in replaced])
+    stats["avg_logprob_after"] = _mean([s.get("avg_logprob", 0) for s in high_segments])
+    stats["low_confidence_before"] = sum(1 for s in replaced if s.get("avg_logprob", 0) < logprob_threshold)
+    stats["low_confidence_after"] = sum(1 for s in high_segments if s.get("avg_logprob", 0) < logprob_threshold)
+
+    result["segments"] = merged
+    result["text"] = "".join(s.get("text", "") for s in merged)
+    print(f"自适应音质: 低码率 {stats['low_bytes']} 字节 + 高码率局部 {stats['high_fetched_bytes']} 字节，"
+          f"相比整段高码率 {stats['high_total_bytes']} 字节节省 {stats['saved_bytes']} 字节；"
+          f"替换 {len(replaced)} 个片段，平均对数概率 {stats['avg_logprob_before']} → {stats['avg_logprob_after']}；"
+          f"未采用 {stats['rejected_ranges']} 个区间，失败 {stats['failed_ranges']} 个区间")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="低码率优先的自适应转写：只对低置信度片段拉取高码率局部重转")
+    parser.add_argument("low_audio", help="低码率音频路径")
+    parser.add_argument("high_url", help="高码率播放链接（playUrlHigh）")
+    parser.add_argument("--model", type=str, default="base", choices=["tiny", "base", "small", "medium", "large"], help="Whisper模型，默认base")
+    parser.add_argument("--logprob-threshold", type=float, default=-1.0, help="低置信度阈值，默认-1.0")
+    args = parser.parse_args()
+
+    from audio2txt2comic.whisper_example import simple_transcribe
+
+    low_result = simple_transcribe(args.low_audio, model_name=args.model)
+    result = refine_with_high_quality(low_result, args.low_audio, args.high_url, args.model, args.logprob_threshold)
+    output_file = f"{args.low_audio.split('.')[0]}_adaptive_result.json"
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带解码守卫的 Whisper 转写
+逐个 30 秒窗口解码，在线识别重复循环（幻觉）与低置信度连续片段：
+- 限制温度回退次数，不再对坏窗口跑满整个温度序列
+- 截断重复尾巴并标记片段，重置上下文提示以免循环向后传播
+- 连续多个低置信度窗口（音乐、广告等）时直接单次解码跳过
+统计每期节目节省的解码次数
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Whisper 默认的温度回退序列
+DEFAULT_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+def find_tail_repetition(text: str, max_unit: int = 20, min_repeats: int = 3, min_repeat_chars: int = 12) -> Optional[Tuple[int, int]]:
+    """
+    查找文本末尾的循环重复（解码器陷入循环时重复总是延续到窗口末尾）
+
+    Args:
+        text: 待检测文本
+        max_unit: 重复单元的最大长度（字符）
+        min_repeats: 至少重复多少次
+        min_repeat_chars: 重复部分至少覆盖多少字符
+
+    Returns:
+        (重复单元长度, 重复开始位置)；无循环时返回 None
+    """
+    text = text.rstrip()
+    n = len(text)
+    for unit in range(1, min(max_unit, n // min_repeats) + 1):
+        tail = text[n - unit:]
+        pos = n - unit
+        count = 1
+        while pos - unit >= 0 and text[pos - unit:pos] == tail:
+            count += 1
+            pos -= unit
+        if count >= min_repeats and count * unit >= min_repeat_chars:
+            return unit, pos
+    return None
+
+
+def collapse_tail_repetition(text: str, **kwargs) -> str:
+    """
+    将末尾的循环重复折叠为一次
+    """
+    hit = find_tail_repetition(text, **kwargs)
+    if hit is None:
+        return text
+    unit, pos = hit
+    return text.rstrip()[:pos + unit]
+
+
+class DecodeGuard:
+    """
+    在线解码守卫：根据每次解码结果决定是否继续温度回退，并累计统计
+    """
+
+    def __init__(self,
+                 temperatures: Tuple[float, ...] = DEFAULT_TEMPERATURES,
+                 max_fallbacks: int = 1,
+                 max_bad_run: int = 3,
+                 compression_ratio_threshold: float = 2.4,
+                 logprob_threshold: float = -1.0,
+                 no_speech_threshold: float = 0.6):
+        self.temperatures = tuple(temperatures)
+        # 每个窗口最多回退几次（Whisper 默认会跑满整个温度序列）
+        self.max_fallbacks = max_fallbacks
+        # 连续多少个坏窗口后不再回退
+        self.max_bad_run = max_bad_run
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.logprob_threshold = logprob_threshold
+        self.no_speech_threshold = no_speech_threshold
+        self.bad_run = 0
+        self.stats: Dict[str, Any] = {
+            "windows": 0,
+            "decode_passes": 0,
+            "baseline_passes": 0,
+            "saved_passes": 0,
+            "repetition_windows": 0,
+            "low_confidence_windows": 0,
+            "no_speech_windows": 0,
+            "guard_only_windows": 0,
+            "truncated_chars": 0,
+        }
+
+    def is_no_speech(self, result: Any) -> bool:
+        """
+        Whisper 的静音判定：无语音概率高且平均对数概率低，整窗跳过
+        """
+        return result.no_speech_prob > self.no_speech_threshold and result.avg_logprob < self.logprob_threshold
+
+    def is_repetition(self, result: Any) -> bool:
+        return (result.compression_ratio > self.compression_ratio_threshold
+                or find_tail_repetition(result.text) is not None)
+
+    def whisper_needs_fallback(self, result: Any) -> bool:
+        """
+        Whisper 自身的回退条件：压缩比过高或平均对数概率过低，静音窗口除外
+        """
+        if self.is_no_speech(result):
+            return False
+        return result.compression_ratio > self.compression_ratio_threshold or result.avg_logprob < self.logprob_threshold
+
+    def needs_fallback(self, result: Any) -> bool:
+        """
+        在 Whisper 回退条件之外，把尾部循环也视为需要回退；
+        尾部循环的检测不受 no_speech_prob 影响，只有被判为静音（整窗丢弃）的窗口不再回退
+        """
+        if self.is_no_speech(result):
+            return False
+        return self.whisper_needs_fallback(result) or find_tail_repetition(result.text) is not None
+
+    def pass_budget(self) -> int:
+        """
+        当前窗口允许的解码次数：处于坏窗口连续区间时只解码一次
+        """
+        if self.bad_run >= self.max_bad_run:
+            return 1
+        return min(len(self.temperatures), 1 + self.max_fallbacks)
+
+    def finish_window(self, result: Any, passes: int, whisper_passes: Optional[int] = None) -> Optional[str]:
+        """
+        记录一个窗口的最终解码结果
+
+        Args:
+            result: 最后一次的 DecodingResult
+            passes: 该窗口实际解码次数
+            whisper_passes: 按 Whisper 自身条件第几次解码即可停止；None 表示守卫预算内始终未满足
+
+        Returns:
+            守卫标记："repetition" / "low_confidence" / "no_speech"；正常窗口返回 None
+        """
+        self.stats["windows"] += 1
+        self.stats["decode_passes"] += passes
+        # Whisper 基线：满足其自身条件即停止，否则跑满整个温度序列（估计值）
+        baseline = whisper_passes if whisper_passes is not None else max(passes, len(self.temperatures))
+        self.stats["baseline_passes"] += baseline
+        self.stats["saved_passes"] += baseline - passes
+
+        if self.is_no_speech(result):
+            # 静音窗口与 Whisper 一样直接跳过，不计入坏窗口连续区间
+            self.stats["no_speech_windows"] += 1
+            return "no_speech"
+        if not self.needs_fallback(result):
+            self.bad_run = 0
+            return None
+        mark = "repetition" if self.is_repetition(result) else "low_confidence"
+        self.stats[f"{mark}_windows"] += 1
+        if not self.whisper_needs_fallback(result):
+            # 仅由守卫的尾部循环检测发现、Whisper 本身不会回退的窗口
+            self.stats["guard_only_windows"] += 1
+        self.bad_run += 1
+        return mark
+
+    def report(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        baseline = stats["baseline_passes"]
+        stats["saved_ratio"] = round(stats["saved_passes"] / baseline, 4) if baseline else 0.0
+        return stats
+
+
+def _split_segments(tokens: List[int], timestamp_begin: int, seek: int, segment_size: int,
+                    time_offset: float, time_precision: float, input_stride: int) -> Tuple[List[Tuple[float, float, List[int]]], int]:
+    """
+    按时间戳 token 切分窗口内的片段，返回 (片段列表, 新的 seek)，规则与 Whisper 一致
+    """
+    is_ts = [t >= timestamp_begin for t in tokens]
+    single_timestamp_ending = is_ts[-2:] == [False, True]
+    consecutive = [i + 1 for i in range(len(tokens) - 1) if is_ts[i] and is_ts[i + 1]]
+    segments: List[Tuple[float, float, List[int]]] = []
+
+    if consecutive:
+        slices = list(consecutive)
+        if single_timestamp_ending:
+            slices.append(len(tokens))
+        last_slice = 0
+        for current_slice in slices:
+            sliced = tokens[last_slice:current_slice]
+            start = time_offset + (sliced[0] - timestamp_begin) * time_precision
+            end = time_offset + (sliced[-1] - timestamp_begin) * time_precision
+            segments.append((start, end, sliced))
+            last_slice = current_slice
+        if single_timestamp_ending:
+            seek += segment_size
+        else:
+            seek += (tokens[last_slice - 1] - timestamp_begin) * input_stride
+    else:
+        duration = segment_size * time_precision / input_stride
+        timestamps = [t for t, ts in zip(tokens, is_ts) if ts]
+        if timestamps and timestamps[-1] != timestamp_begin:
+            duration = (timestamps[-1] - timestamp_begin) * time_precision
+        segments.append((time_offset, time_offset + duration, tokens))
+        seek += segment_size
+    return segments, seek
+
+
+def guarded_transcribe(audio_file_path: str, model_name: str = "base", language: str = "zh",
+                       condition_on_previous_text: bool = True, guard: Optional[DecodeGuard] = None,
+                       save_result: bool = True) -> Dict[str, Any]:
+    """
+    带解码守卫的音频转文字，输出结构与 simple_transcribe 一致，另附 guard_stats
+
+    Args:
+        audio_file_path: 音频文件路径
+        model_name: Whisper模型名称（tiny/base/small/medium/large），默认 base
+        language: 语言，默认中文
+        condition_on_previous_text: 是否以前文作为提示
+        guard: 解码守卫，默认使用 DecodeGuard()
+        save_result: 是否保存 *_whisper_result.json
+
+    Returns:
+        转写结果字典
+    """
+    import torch
+    from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE, load_audio, log_mel_spectrogram, pad_or_trim
+    from whisper.decoding import DecodingOptions
+    from whisper.tokenizer import get_tokenizer
+    from audio2txt2comic.whisper_example import get_or_load_model
+
+    guard = guard or DecodeGuard()
+    model = get_or_load_model(model_name)
+    fp16 = model.device.type == "cuda"
+    dtype = torch.float16 if fp16 else torch.float32
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, language=language, task="transcribe")
+
+    print(f"开始守卫转录: {audio_file_path}")
+    mel = log_mel_spectrogram(load_audio(audio_file_path), model.dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-1] - N_FRAMES
+    input_stride = N_FRAMES // model.dims.n_audio_ctx
+    time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE
+
+    seek = 0
+    all_tokens: List[int] = []
+    prompt_reset_since = 0
+    segments: List[Dict[str, Any]] = []
+
+    while seek < content_frames:
+        window_seek = seek
+        time_offset = float(seek * HOP_LENGTH / SAMPLE_RATE)
+        segment_size = min(N_FRAMES, content_frames - seek)
+        mel_segment = pad_or_trim(mel[:, seek:seek + segment_size], N_FRAMES).to(model.device).to(dtype)
+        prompt = all_tokens[prompt_reset_since:][-(model.dims.n_text_ctx // 2 - 1):]
+
+        result = None
+        passes = 0
+        whisper_passes = None
+        for temperature in guard.temperatures[:guard.pass_budget()]:
+            options = DecodingOptions(task="transcribe", language=language, temperature=temperature,
+                                      prompt=prompt, fp16=fp16)
+            result = model.decode(mel_segment, options)
+            passes += 1
+            if whisper_passes is None and not guard.whisper_needs_fallback(result):
+                whisper_passes = passes
+            if not guard.needs_fallback(result):
+                break
+
+        mark = guard.finish_window(result, passes, whisper_passes)
+        if mark == "no_speech":
+            seek += segment_size
+            continue
+
+        tokens = list(result.tokens)
+        if mark == "repetition":
+            # 循环窗口：截断重复尾巴，整窗跳过，避免在循环中间重新对齐
+            segment_parts = [(time_offset, time_offset + segment_size * time_precision / input_stride, tokens)]
+            seek += segment_size
+        else:
+            segment_parts, seek = _split_segments(tokens, tokenizer.timestamp_begin, seek, segment_size,
+                                                  time_offset, time_precision, input_stride)
+            if seek <= window_seek:
+                seek = window_seek + segment_size
+
+        for start, end, seg_tokens in segment_parts:
+            text = tokenizer.decode([t for t in seg_tokens if t < tokenizer.eot])
+            if mark == "repetition":
+                collapsed = collapse_tail_repetition(text)
+                guard.stats["truncated_chars"] += len(text) - len(collapsed)
+                text = collapsed
+            if not text.strip() or start == end:
+                continue
+            segment = {
+                "id": len(segments),
+                "seek": window_seek,
+                "start": round(start, 2),
+                "end": round(end, 2),
+                "text": text,
+                "tokens": seg_tokens,
+                "temperature": result.temperature,
+                "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio,
+                "no_speech_prob": result.no_speech_prob,
+            }
+            if mark:
+                segment["guard"] = mark
+            segments.append(segment)
+        all_tokens.extend(tokens)
+
+        # 坏窗口或高温解码后重置提示，避免循环沿上下文传播
+        if not condition_on_previous_text or mark or result.temperature > 0.5:
+            prompt_reset_since = len(all_tokens)
+
+    stats = guard.report()
+    output = {
+        "text": "".join(s["text"] for s in segments),
+        "segments": segments,
+        "language": language,
+        "guard_stats": stats,
+    }
+    print(f"守卫统计: 窗口 {stats['windows']} 个，解码 {stats['decode_passes']} 次，"
+          f"估计节省 {stats['saved_passes']} 次（{stats['saved_ratio']:.1%}），"
+          f"循环 {stats['repetition_windows']} 个（其中仅守卫发现 {stats['guard_only_windows']} 个），"
+          f"低置信度 {stats['low_confidence_windows']} 个")
+
+    if save_result:
+        output_file = f"{audio_file_path.split('.')[0]}_whisper_result.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {output_file}")
+    return output
+
+
+def summarize_segment_quality(result: Dict[str, Any], compression_ratio_threshold: float = 2.4,
+                              logprob_threshold: float = -1.0, no_speech_threshold: float = 0.6) -> Dict[str, int]:
+    """
+    对已有的 Whisper 结果做离线质量统计（复用片段中的 compression_ratio/avg_logprob/no_speech_prob）
+    """
+    summary = {"segments": 0, "repetition": 0, "low_confidence": 0, "no_speech": 0}
+    for seg in result.get("segments", []):
+        summary["segments"] += 1
+        if seg.get("no_speech_prob", 0) > no_speech_threshold and seg.get("avg_logprob", 0) < logprob_threshold:
+            summary["no_speech"] += 1
+        elif seg.get("compression_ratio", 0) > compression_ratio_threshold or find_tail_repetition(seg.get("text", "")):
+            summary["repetition"] += 1
+        elif seg.get("avg_logprob", 0) < logprob_threshold:
+            summary["low_confidence"] += 1
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="带解码守卫的 Whisper 转写 / 已有结果质量统计")
+    parser.add_argument("path", help="音频文件路径，或 --summary 时的 *_whisper_result.json")
+    parser.add_argument("--model", default="base", choices=["tiny", "base", "small", "medium", "large"], help="Whisper模型，默认base")
+    parser.add_argument("--max-fallbacks", type=int, default=1, help="每个窗口最多温度回退次数，默认1")
+    parser.add_argument("--summary", action="store_true", help="仅统计已有结果文件的片段质量")
+    args = parser.parse_args()
+
+    if args.summary:
+        with open(args.path, "r", encoding="utf-8") as f:
+            print(summarize_segment_quality(json.load(f)))
+    else:
+        guarded_transcribe(args.path, args.model, guard=DecodeGuard(max_fallbacks=args.max_fallbacks))
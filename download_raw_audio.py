@@ -3,39 +3,307 @@
 """
 音频下载脚本
 根据节目类型自动选择JSON文件并下载音频到raw_audio目录
+raw_audio/ 为内容寻址存储：
+- raw_audio/blobs/<sha256前2位>/<sha256>.m4a  按内容哈希存放，相同内容只存一份
+- raw_audio/items/<id>_<quality>.m4a          按 listByDate id 命名，硬链接到 blob
+- raw_audio/results/<id>_<quality>.json      转写提炼结果，音频被淘汰后仍可复用
+- raw_audio/index.json                        记录 id/节目/日期/音质 → blob 的映射与转写状态
 """
 
 import json
 import os
+import time
+import shutil
+import hashlib
 import requests
 import argparse
+from typing import List, Optional, Dict, Any
 from urllib.parse import urlparse
 from pathlib import Path
 
+from fetch_yuntin_audio_json import normalize_program_name
+
+# 历史节目沿用原有文件名，其他节目按规范节目名生成
+LEGACY_JSON_FILES = {
+    "那些年": "audio_output/yuntin_those_years_audio.json",
+    "财经阅读": "audio_output/yuntin_finance_audio.json",
+}
+
 def get_json_file_path(program_name: str) -> str:
     """
     根据节目名称获取对应的JSON文件路径
     
     Args:
-        program_name: 节目名称
+        program_name: 节目名称（可带重播标记，按规范节目名处理）
         
     Returns:
         JSON文件路径
     """
-    if program_name == "那些年":
-        return "audio_output/yuntin_those_years_audio.json"
-    elif program_name == "财经阅读":
-        return "audio_output/yuntin_finance_audio.json"
-    else:
+    program_key, _ = normalize_program_name(program_name)
+    if not program_key:
         raise ValueError(f"不支持的节目类型: {program_name}")
+    return LEGACY_JSON_FILES.get(program_key, f"audio_output/yuntin_{program_key}_audio.json")
+
+RAW_AUDIO_DIR = "raw_audio"
 
-def download_audio_file(url: str, filepath: str) -> bool:
+
+class RawAudioStore:
+    """
+    内容寻址的原始音频存储
+    以 listByDate id + 音质为键，内容哈希去重，按总大小淘汰已转写的音频
+    """
+
+    def __init__(self, root: str = RAW_AUDIO_DIR):
+        self.root = root
+        self.index_file = os.path.join(root, "index.json")
+        self.index: Dict[str, Any] = {"items": {}, "blobs": {}}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except Exception as e:
+                print(f"读取音频索引失败: {e}")
+
+    @staticmethod
+    def item_key(item_id: str, quality: str) -> str:
+        return f"{item_id}:{quality}"
+
+    def item_path(self, item_id: str, quality: str) -> str:
+        return os.path.join(self.root, "items", f"{item_id}_{quality}.m4a")
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "blobs", sha256[:2], f"{sha256}.m4a")
+
+    def result_path(self, item_id: str, quality: str) -> str:
+        return os.path.join(self.root, "results", f"{item_id}_{quality}.json")
+
+    def get(self, item_id: str, quality: str) -> Optional[Dict[str, Any]]:
+        return self.index["items"].get(self.item_key(item_id, quality))
+
+    def has(self, item_id: str, quality: str) -> bool:
+        """
+        音频是否已在存储中（文件存在）
+        """
+        entry = self.get(item_id, quality)
+        return entry is not None and os.path.exists(self.item_path(item_id, quality))
+
+    def find(self, program_key: str, release_date: str, quality: str) -> List[Dict[str, Any]]:
+        """
+        按节目/日期/音质查找条目（同一天同一节目可能有多条）
+        """
+        return [e for e in self.index["items"].values()
+                if e.get("program_key") == program_key and e.get("release_date") == release_date and e.get("quality") == quality]
+
+    def put(self, item: Dict[str, Any], quality: str, tmp_path: str, sha256: str, url: str) -> str:
+        """
+        将下载好的临时文件放入存储；内容相同的 blob 已存在时直接复用并硬链接
+
+        Returns:
+            条目路径 raw_audio/items/<id>_<quality>.m4a
+        """
+        blob_path = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            print(f"内容已存在，复用 blob: {sha256[:12]}")
+        else:
+            os.replace(tmp_path, blob_path)
+        self.index["blobs"][sha256] = {"size": os.path.getsize(blob_path)}
+
+        item_id = str(item.get('id'))
+        item_path = self.item_path(item_id, quality)
+        os.makedirs(os.path.dirname(item_path), exist_ok=True)
+        if os.path.exists(item_path):
+            os.remove(item_path)
+        copied = False
+        try:
+            os.link(blob_path, item_path)
+        except OSError:
+            # 文件系统不支持硬链接时退化为复制，复制出的文件单独计入总大小
+            shutil.copy2(blob_path, item_path)
+            copied = True
+
+        key = self.item_key(item_id, quality)
+        previous = self.index["items"].get(key)
+        self.index["items"][key] = {
+            "id": item_id,
+            "quality": quality,
+            "program_name": item.get('program_name'),
+            "program_key": item.get('program_key') or normalize_program_name(item.get('program_name', ''))[0],
+            "release_date": item.get('release_date'),
+            "url": url,
+            "sha256": sha256,
+            "size": self.index["blobs"][sha256]["size"],
+            "copied": copied,
+            "transcribed": False,
+            "evicted": False,
+            "last_access": time.time(),
+        }
+        if previous and previous.get("sha256") != sha256:
+            self._release_blob(previous["sha256"])
+        return item_path
+
+    def _release_blob(self, sha256: str) -> None:
+        """
+        条目改指向新内容后，旧 blob 不再被任何未淘汰条目引用时删除文件；完全无人引用时移出索引
+        """
+        entries = [e for e in self.index["items"].values() if e.get("sha256") == sha256]
+        if any(not e.get("evicted") for e in entries):
+            return
+        blob_path = self.blob_path(sha256)
+        if os.path.exists(blob_path):
+            os.remove(blob_path)
+        if not entries:
+            self.index["blobs"].pop(sha256, None)
+
+    def mark_transcribed(self, item_id: str, quality: str, result: Optional[Dict[str, Any]] = None) -> None:
+        """
+        标记已转写，并保存转写提炼结果供音频淘汰后复用
+        """
+        entry = self.get(item_id, quality)
+        if entry is None:
+            return
+        entry["transcribed"] = True
+        entry["last_access"] = time.time()
+        if result:
+            result_path = self.result_path(item_id, quality)
+            os.makedirs(os.path.dirname(result_path), exist_ok=True)
+            tmp_file = f"{result_path}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, result_path)
+
+    def load_result(self, item_id: str, quality: str) -> Optional[Dict[str, Any]]:
+        """
+        读取已保存的转写提炼结果，没有时返回 None
+        """
+        result_path = self.result_path(item_id, quality)
+        if not os.path.exists(result_path):
+            return None
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取转写结果失败 {result_path}: {e}")
+            return None
+
+    def is_evicted_with_result(self, item_id: str, quality: str) -> bool:
+        """
+        音频已淘汰但转写结果仍在，可直接复用而无需重新下载
+        """
+        entry = self.get(item_id, quality)
+        return bool(entry and entry.get("evicted") and entry.get("transcribed")
+                    and os.path.exists(self.result_path(item_id, quality)))
+
+    def import_legacy(self, items: List[Dict[str, Any]], quality: str) -> int:
+        """
+        一次性把旧版 raw_audio/节目名_日期_音质.m4a 导入存储
+        只导入能唯一对应到一条音频的文件（同一天同一节目只有一条）；有歧义的保留原样，按 id 重新下载
+
+        Returns:
+            导入的文件数
+        """
+        by_filename: Dict[str, List[Dict[str, Any]]] = {}
+        for item in items:
+            if item.get('id') and item.get('program_name') and item.get('release_date'):
+                filename = get_audio_filename(item['program_name'], item['release_date'], quality)
+                by_filename.setdefault(filename, []).append(item)
+
+        imported = 0
+        for filename, candidates in by_filename.items():
+            legacy_path = os.path.join(self.root, filename)
+            if not os.path.exists(legacy_path):
+                continue
+            if len(candidates) > 1:
+                print(f"旧版文件对应多条音频，无法确定归属，将按 id 重新下载: {legacy_path}")
+                continue
+            item = candidates[0]
+            if self.has(str(item['id']), quality):
+                continue
+            hasher = hashlib.sha256()
+            with open(legacy_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+            self.put(item, quality, legacy_path, hasher.hexdigest(), item.get('play_url_high' if quality == "high" else 'play_url_low'))
+            print(f"已导入旧版文件: {legacy_path} → id={item['id']}")
+            imported += 1
+        if imported:
+            self.save()
+        return imported
+
+    def total_bytes(self) -> int:
+        """
+        存储实际占用：blob 加上不支持硬链接时复制出的条目文件
+        """
+        blob_bytes = sum(b["size"] for sha, b in self.index["blobs"].items() if os.path.exists(self.blob_path(sha)))
+        copy_bytes = sum(e["size"] for e in self.index["items"].values()
+                         if e.get("copied") and os.path.exists(self.item_path(e["id"], e["quality"])))
+        return blob_bytes + copy_bytes
+
+    def enforce_retention(self, max_bytes: int) -> int:
+        """
+        总大小超过 max_bytes 时，按最近访问时间从旧到新淘汰已全部转写（且保存了结果）的 blob
+
+        Returns:
+            释放的字节数
+        """
+        total = self.total_bytes()
+        if max_bytes <= 0 or total <= max_bytes:
+            return 0
+        by_blob: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self.index["items"].values():
+            if not entry.get("evicted"):
+                by_blob.setdefault(entry["sha256"], []).append(entry)
+        # 只淘汰全部条目都已转写且保存了转写结果的 blob，保证淘汰后仍能产出提炼结果
+        candidates = sorted(
+            (max(e["last_access"] for e in entries), sha)
+            for sha, entries in by_blob.items()
+            if all(e.get("transcribed") and os.path.exists(self.result_path(e["id"], e["quality"])) for e in entries)
+        )
+        freed = 0
+        for _, sha in candidates:
+            if total - freed <= max_bytes:
+                break
+            for entry in by_blob[sha]:
+                item_path = self.item_path(entry["id"], entry["quality"])
+                if os.path.exists(item_path):
+                    os.remove(item_path)
+                    if entry.get("copied"):
+                        freed += entry["size"]
+                entry["evicted"] = True
+            blob_path = self.blob_path(sha)
+            if os.path.exists(blob_path):
+                os.remove(blob_path)
+                freed += self.index["blobs"][sha]["size"]
+        print(f"音频存储淘汰: 释放 {freed} 字节，当前 {total - freed} 字节（上限 {max_bytes}）")
+        return freed
+
+    def save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+
+def get_audio_path(item: Dict[str, Any], quality: str = "high", root: str = RAW_AUDIO_DIR) -> str:
+    """
+    获取音频在存储中的路径（按 listByDate id 命名）；没有 id 的旧数据退回节目+日期命名
+    """
+    item_id = item.get('id')
+    if item_id:
+        return os.path.join(root, "items", f"{item_id}_{quality}.m4a")
+    return os.path.join(root, get_audio_filename(item.get('program_name', ''), item.get('release_date', ''), quality))
+
+
+def download_audio_file(url: str, filepath: str, hasher: Optional[Any] = None) -> bool:
     """
     下载音频文件
     
     Args:
         url: 音频文件URL
         filepath: 保存路径
+        hasher: 可选，边下载边计算内容哈希
         
     Returns:
         是否下载成功
@@ -55,6 +323,8 @@ def download_audio_file(url: str, filepath: str) -> bool:
         with open(filepath, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
                 f.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
         
         print(f"下载完成: {filepath}")
         return True
@@ -75,33 +345,20 @@ def get_audio_filename(program_name: str, release_date: str, quality: str = "hig
     Returns:
         文件名
     """
+    # 旧版命名：同一天同一节目有多条时会冲突，新下载请使用 get_audio_path
     # 清理文件名中的特殊字符
     safe_program_name = program_name.replace('(', '').replace(')', '').replace('（', '').replace('）', '')
     return f"{safe_program_name}_{release_date}_{quality}.m4a"
 
-def check_file_exists(program_name: str, release_date: str, quality: str = "high") -> bool:
-    """
-    检查音频文件是否已存在
-    
-    Args:
-        program_name: 节目名称
-        release_date: 发布日期
-        quality: 音质
-        
-    Returns:
-        文件是否存在
-    """
-    filename = get_audio_filename(program_name, release_date, quality)
-    filepath = os.path.join('raw_audio', filename)
-    return os.path.exists(filepath)
-
-def download_from_json(json_file: str, quality: str = "high") -> None:
+def download_from_json(json_file: str, quality: str = "high", programs: Optional[List[str]] = None, max_bytes: int = 0) -> None:
     """
-    从JSON文件下载音频
+    从JSON文件下载音频到内容寻址存储
     
     Args:
         json_file: JSON文件路径
         quality: 音质选择 (high/low)
+        programs: 仅下载这些规范节目名，None 表示不过滤
+        max_bytes: raw_audio/ 总大小上限，超过时淘汰已转写的音频；0 表示不限制
     """
     try:
         with open(json_file, 'r', encoding='utf-8') as f:
@@ -110,6 +367,8 @@ def download_from_json(json_file: str, quality: str = "high") -> None:
         print(f"读取JSON文件失败: {e}")
         return
     
+    store = RawAudioStore()
+    store.import_legacy([item for audio_items in data.values() for item in audio_items], quality)
     download_count = 0
     success_count = 0
     skip_count = 0
@@ -124,6 +383,11 @@ def download_from_json(json_file: str, quality: str = "high") -> None:
             if not program_name or not release_date:
                 continue
             
+            if programs is not None:
+                program_key = item.get('program_key') or normalize_program_name(program_name)[0]
+                if program_key not in programs:
+                    continue
+            
             # 选择音质
             if quality == "high":
                 audio_url = item.get('play_url_high')
@@ -134,37 +398,53 @@ def download_from_json(json_file: str, quality: str = "high") -> None:
                 print(f"跳过 {program_name} {release_date}: 无{quality}音质链接")
                 continue
             
-            # 检查文件是否已存在
-            if check_file_exists(program_name, release_date, quality):
-                print(f"文件已存在，跳过: {program_name}_{release_date}_{quality}.m4a")
-                skip_count += 1
+            item_id = item.get('id')
+            if not item_id:
+                print(f"跳过 {program_name} {release_date}: 缺少 id")
                 continue
             
-            # 生成文件名
-            filename = get_audio_filename(program_name, release_date, quality)
-            filepath = os.path.join('raw_audio', filename)
+            # 检查文件是否已存在（按 id，同一天同一节目的多条互不覆盖）；已淘汰但转写结果还在的无需重新下载
+            if store.has(item_id, quality) or store.is_evicted_with_result(item_id, quality):
+                print(f"文件已存在或已转写，跳过: {program_name} {release_date} id={item_id} {quality}")
+                skip_count += 1
+                continue
             
+            tmp_path = os.path.join(store.root, "tmp", f"{item_id}_{quality}.part")
+            hasher = hashlib.sha256()
             download_count += 1
-            if download_audio_file(audio_url, filepath):
+            if download_audio_file(audio_url, tmp_path, hasher):
+                store.put(item, quality, tmp_path, hasher.hexdigest(), audio_url)
+                store.save()
                 success_count += 1
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    if max_bytes > 0:
+        store.enforce_retention(max_bytes)
+        store.save()
     
     print(f"\n下载完成: 成功 {success_count}/{download_count} 个文件，跳过 {skip_count} 个已存在文件")
 
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='音频下载工具')
-    parser.add_argument('program_name', choices=['那些年', '财经阅读'], help='节目类型')
+    parser.add_argument('program_name', help='节目名称，如 那些年、财经阅读')
     parser.add_argument('--quality', choices=['high', 'low'], default='high', 
                        help='音质选择 (默认: high)')
+    parser.add_argument('--json', type=str, default=None,
+                       help='指定JSON文件（如 fetch 输出的多节目文件），仅下载其中该节目的音频')
+    parser.add_argument('--max-gb', type=float, default=0,
+                       help='raw_audio/ 总大小上限（GB），超过时淘汰已转写的音频；0 表示不限制')
     
     args = parser.parse_args()
     
     # 根据节目名称获取JSON文件路径
     try:
-        json_file = get_json_file_path(args.program_name)
+        json_file = args.json or get_json_file_path(args.program_name)
     except ValueError as e:
         print(f"错误: {e}")
         return
+    program_key = normalize_program_name(args.program_name)[0]
     
     if not os.path.exists(json_file):
         print(f"JSON文件不存在: {json_file}")
@@ -177,7 +457,7 @@ def main():
     print(f"音质选择: {args.quality}")
     print(f"输出目录: raw_audio/")
     
-    download_from_json(json_file, args.quality)
+    download_from_json(json_file, args.quality, [program_key], int(args.max_gb * 1024 ** 3))
 
 if __name__ == "__main__":
     main()
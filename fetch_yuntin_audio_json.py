@@ -2,22 +2,189 @@
 # -*- coding: utf-8 -*-
 """
 云听音频数据获取和分析脚本
-获取云听所有音频链接，分析那些年非重播的音频
+获取云听多个频道（broadcastId）的音频链接，按规范节目名筛选非重播的音频
 """
 
 import requests
 import json
 import re
 import argparse
+import gzip
+import hashlib
 import os
+import unicodedata
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+DEFAULT_BROADCAST_ID = "640"
+# "全部" 对应的默认节目集合
+DEFAULT_PROGRAMS = ["那些年", "财经阅读"]
+# 不限节目：匹配所有规范节目名
+ALL_PROGRAMS = "*"
+PROGRAM_INDEX_FILE = "audio_input/program_index.json"
+
+# 进程内缓存：缓存文件路径 → (文件修改时间ns, 已解析数据)，避免同一进程重复解析同一天
+_CACHE_MEMO: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+# 重播标记：NFKC 归一化后全角括号已转为半角，兼容 "（重播）" 与 "(重播)"
+_REPLAY_PATTERN = re.compile(r"\s*\(\s*重播\s*\)\s*$")
+
+
+@lru_cache(maxsize=None)
+def normalize_program_name(program_name: str) -> Tuple[str, bool]:
+    """
+    归一化节目名称，剥离重播标记
+
+    Args:
+        program_name: listByDate 返回的原始 programName
+
+    Returns:
+        (规范节目名, 是否重播)
+    """
+    name = unicodedata.normalize('NFKC', program_name or '').strip()
+    base_name, count = _REPLAY_PATTERN.subn('', name)
+    return base_name.strip(), count > 0
+
+
+def parse_program_filter(program_type: str) -> Optional[List[str]]:
+    """
+    解析节目筛选参数
+
+    Args:
+        program_type: "全部"、"*" 或逗号分隔的节目名
+
+    Returns:
+        规范节目名列表；None 表示不限节目
+    """
+    if program_type == ALL_PROGRAMS:
+        return None
+    if program_type == "全部":
+        return list(DEFAULT_PROGRAMS)
+    names = [normalize_program_name(p)[0] for p in program_type.split(',')]
+    return [n for n in names if n]
+
+
+class ProgramIndex:
+    """
+    节目规范化索引
+    将 (broadcastId, columnId) 与原始 programName 预先映射到规范节目键，
+    重播栏目与首播栏目归入同一个键，供跨频道、跨日期的节目追踪使用。
+    """
 
-class YuntinAudioAnalyzer:
     def __init__(self):
+        # 规范节目键 → 节目信息；columns 记录实际出现过的 [broadcastId, columnId, 是否重播, programName]
+        self.programs: Dict[str, Dict[str, Any]] = {}
+        # (broadcastId, columnId) → (规范节目键, 是否重播, 原始 programName)
+        self._column_lookup: Dict[Tuple[str, str], Tuple[str, bool, str]] = {}
+
+    def add_item(self, item: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        登记一条 listByDate 记录并返回其 (规范节目键, 是否重播)
+        栏目改名（programName 与登记时不同）时重新归一化并迁移到新的节目键
+        """
+        broadcast_id = str(item.get('broadcastId') or '')
+        column_id = str(item.get('columnId') or '')
+        column_key = (broadcast_id, column_id)
+        raw_name = item.get('programName', '')
+        hit = self._column_lookup.get(column_key) if column_id else None
+        if hit is not None and hit[2] == raw_name:
+            return hit[0], hit[1]
+
+        program_key, is_replay = normalize_program_name(raw_name)
+        if hit is not None:
+            self._remove_column(hit[0], column_key)
+        if not program_key:
+            return '', is_replay
+
+        entry = self.programs.setdefault(program_key, {
+            'program_name': program_key,
+            'aliases': [],
+            'columns': [],
+        })
+        if raw_name and raw_name not in entry['aliases']:
+            entry['aliases'].append(raw_name)
+        if column_id:
+            entry['columns'].append([broadcast_id, column_id, is_replay, raw_name])
+            self._column_lookup[column_key] = (program_key, is_replay, raw_name)
+        return program_key, is_replay
+
+    def _remove_column(self, program_key: str, column_key: Tuple[str, str]) -> None:
+        entry = self.programs.get(program_key)
+        if entry is not None:
+            entry['columns'] = [c for c in entry['columns'] if (c[0], c[1]) != column_key]
+        self._column_lookup.pop(column_key, None)
+
+    def add_items(self, audio_data: Dict[str, Any]) -> None:
+        """
+        登记一份 listByDate 响应中的全部记录
+        """
+        for item in (audio_data or {}).get('data', []):
+            self.add_item(item)
+
+    def to_dict(self) -> Dict[str, Any]:
+        programs = {}
+        for program_key, entry in sorted(self.programs.items()):
+            columns = entry['columns']
+            programs[program_key] = {
+                'program_name': program_key,
+                'broadcast_ids': sorted({c[0] for c in columns if c[0]}),
+                'column_ids': sorted({c[1] for c in columns if not c[2]}),
+                'replay_column_ids': sorted({c[1] for c in columns if c[2]}),
+                'aliases': entry['aliases'],
+                'columns': columns,
+            }
+        return {'programs': programs}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProgramIndex":
+        index = cls()
+        for program_key, entry in (data or {}).get('programs', {}).items():
+            columns = [list(c) for c in entry.get('columns', [])]
+            index.programs[program_key] = {
+                'program_name': program_key,
+                'aliases': list(entry.get('aliases', [])),
+                'columns': columns,
+            }
+            for broadcast_id, column_id, is_replay, raw_name in columns:
+                index._column_lookup[(broadcast_id, column_id)] = (program_key, bool(is_replay), raw_name)
+        return index
+
+    @classmethod
+    def load(cls, path: str = PROGRAM_INDEX_FILE) -> "ProgramIndex":
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return cls.from_dict(json.load(f))
+            except Exception as e:
+                print(f"读取节目索引失败: {e}")
+        return cls()
+
+    def save(self, path: str = PROGRAM_INDEX_FILE) -> None:
+        try:
+            output_dir = os.path.dirname(path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            print(f"节目索引已保存到 {path}，共 {len(self.programs)} 个节目")
+        except Exception as e:
+            print(f"保存节目索引失败: {e}")
+
+
+class YuntinAudioAnalyzer:
+    def __init__(self, request_interval: float = 1.0, revalidate_interval: float = 600.0, settle_hours: float = 24.0):
         self.base_url = "https://60.205.171.165/contentBiz/appProgram/listByDate"
+        # 每次实际发起网络请求后的间隔（秒），避免请求过于频繁
+        self.request_interval = request_interval
+        # 近期日期缓存的重新验证间隔（秒）
+        self.revalidate_interval = revalidate_interval
+        # 日期结束后再过多少小时获取的数据视为不可变
+        self.settle_hours = settle_hours
+        self.program_index = ProgramIndex.load()
         self.session = requests.Session()
         # 设置请求头，模拟浏览器访问
         self.session.headers.update({
@@ -46,58 +213,168 @@ class YuntinAudioAnalyzer:
             date_list.append(date_str)
         return date_list
 
-    def get_cache_file_path(self, date: str) -> str:
+    def get_cache_file_path(self, date: str, broadcast_id: str = DEFAULT_BROADCAST_ID) -> str:
         """
-        获取缓存文件路径
+        获取缓存文件路径（gzip 压缩的紧凑 JSON）
+        默认频道沿用 audio_input/<date>.json.gz，其他频道放在 audio_input/<broadcastId>/ 下
         
         Args:
             date: 日期字符串，格式为YYYYMMDD
+            broadcast_id: 广播ID
             
         Returns:
             缓存文件路径
         """
-        return f"audio_input/{date}.json"
+        if broadcast_id == DEFAULT_BROADCAST_ID:
+            return f"audio_input/{date}.json.gz"
+        return f"audio_input/{broadcast_id}/{date}.json.gz"
+    
+    def get_legacy_cache_file_path(self, date: str, broadcast_id: str = DEFAULT_BROADCAST_ID) -> str:
+        """
+        获取旧版未压缩缓存文件路径（只读兼容）
+        """
+        return self.get_cache_file_path(date, broadcast_id)[:-len('.gz')]
+    
+    def get_cache_meta_path(self, date: str, broadcast_id: str = DEFAULT_BROADCAST_ID) -> str:
+        """
+        获取缓存元数据路径，记录 ETag/Last-Modified、内容哈希与获取时间
+        """
+        return self.get_cache_file_path(date, broadcast_id)[:-len('.json.gz')] + '.meta.json'
     
-    def load_cached_data(self, date: str) -> Dict[str, Any]:
+    @staticmethod
+    def content_hash(data: Dict[str, Any]) -> str:
+        """
+        计算响应内容哈希（键排序后的紧凑 JSON），用于判断内容是否变化
         """
-        从缓存加载数据
+        payload = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def load_cache_meta(self, date: str, broadcast_id: str = DEFAULT_BROADCAST_ID) -> Dict[str, Any]:
+        """
+        读取缓存元数据；旧版缓存没有元数据时以文件修改时间作为获取时间
+        """
+        meta_file = self.get_cache_meta_path(date, broadcast_id)
+        if os.path.exists(meta_file):
+            try:
+                with open(meta_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"读取缓存元数据失败: {e}")
+        for cache_file in (self.get_cache_file_path(date, broadcast_id), self.get_legacy_cache_file_path(date, broadcast_id)):
+            if os.path.exists(cache_file):
+                return {'fetched_at': os.path.getmtime(cache_file)}
+        return {}
+    
+    def save_cache_meta(self, date: str, meta: Dict[str, Any], broadcast_id: str = DEFAULT_BROADCAST_ID) -> None:
+        meta_file = self.get_cache_meta_path(date, broadcast_id)
+        try:
+            os.makedirs(os.path.dirname(meta_file), exist_ok=True)
+            with open(meta_file, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"保存缓存元数据失败: {e}")
+    
+    def is_frozen(self, date: str, fetched_at: float) -> bool:
+        """
+        判断缓存是否已冻结：该日结束并过了 settle_hours 之后获取的数据视为不可变
+        
+        Args:
+            date: 日期字符串，格式为YYYYMMDD
+            fetched_at: 缓存获取时间（时间戳）
+        """
+        settled_at = datetime.strptime(date, '%Y%m%d') + timedelta(days=1, hours=self.settle_hours)
+        return fetched_at >= settled_at.timestamp()
+    
+    def needs_revalidation(self, date: str, meta: Dict[str, Any]) -> bool:
+        """
+        判断缓存是否需要重新验证：冻结的历史日期从不重验，近期日期超过重验间隔才重验
+        """
+        fetched_at = meta.get('fetched_at', 0)
+        if self.is_frozen(date, fetched_at):
+            return False
+        return time.time() - fetched_at >= self.revalidate_interval
+    
+    def load_cached_data(self, date: str, broadcast_id: str = DEFAULT_BROADCAST_ID) -> Dict[str, Any]:
+        """
+        从缓存加载数据，优先使用进程内缓存（按文件修改时间校验）
         
         Args:
             date: 日期字符串，格式为YYYYMMDD
+            broadcast_id: 广播ID
             
         Returns:
             缓存的音频数据字典
         """
-        cache_file = self.get_cache_file_path(date)
-        if os.path.exists(cache_file):
+        for cache_file in (self.get_cache_file_path(date, broadcast_id), self.get_legacy_cache_file_path(date, broadcast_id)):
+            try:
+                mtime_ns = os.stat(cache_file).st_mtime_ns
+            except OSError:
+                continue
+            memo = _CACHE_MEMO.get(cache_file)
+            if memo is not None and memo[0] == mtime_ns:
+                return memo[1]
             try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                print(f"从缓存加载 {date} 的数据，共 {len(data.get('data', []))} 条音频记录")
+                if cache_file.endswith('.gz'):
+                    with gzip.open(cache_file, 'rb') as f:
+                        data = json.loads(f.read())
+                else:
+                    with open(cache_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                _CACHE_MEMO[cache_file] = (mtime_ns, data)
+                print(f"从缓存加载 {broadcast_id}/{date} 的数据，共 {len(data.get('data', []))} 条音频记录")
+                if not cache_file.endswith('.gz'):
+                    self.migrate_legacy_cache(date, data, broadcast_id)
                 return data
             except Exception as e:
                 print(f"读取缓存文件失败: {e}")
         return {}
     
-    def save_cached_data(self, date: str, data: Dict[str, Any]) -> None:
+    def migrate_legacy_cache(self, date: str, data: Dict[str, Any], broadcast_id: str = DEFAULT_BROADCAST_ID) -> None:
+        """
+        将旧版未压缩缓存一次性转存为 gzip 并写入元数据，成功后删除旧文件
+        沿用旧文件的修改时间作为获取时间，已冻结的日期迁移后仍保持冻结
         """
-        保存数据到缓存
+        legacy_file = self.get_legacy_cache_file_path(date, broadcast_id)
+        meta = self.load_cache_meta(date, broadcast_id)
+        meta.setdefault('sha256', self.content_hash(data))
+        self.save_cached_data(date, data, broadcast_id, meta)
+        if os.path.exists(self.get_cache_file_path(date, broadcast_id)):
+            try:
+                os.remove(legacy_file)
+            except OSError as e:
+                print(f"删除旧版缓存文件失败: {e}")
+            _CACHE_MEMO.pop(legacy_file, None)
+    
+    def save_cached_data(self, date: str, data: Dict[str, Any], broadcast_id: str = DEFAULT_BROADCAST_ID, meta: Optional[Dict[str, Any]] = None) -> None:
+        """
+        保存数据到缓存（gzip 压缩的紧凑 JSON，原子替换）
         
         Args:
             date: 日期字符串，格式为YYYYMMDD
             data: 音频数据字典
+            broadcast_id: 广播ID
+            meta: 缓存元数据（ETag/Last-Modified/内容哈希等）
         """
-        cache_file = self.get_cache_file_path(date)
+        cache_file = self.get_cache_file_path(date, broadcast_id)
         try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            tmp_file = f"{cache_file}.tmp"
+            with gzip.open(tmp_file, 'wb', compresslevel=6) as f:
+                f.write(payload)
+            os.replace(tmp_file, cache_file)
+            _CACHE_MEMO[cache_file] = (os.stat(cache_file).st_mtime_ns, data)
             print(f"数据已缓存到 {cache_file}")
         except Exception as e:
             print(f"保存缓存文件失败: {e}")
+            return
+        self.save_cache_meta(date, meta or {'sha256': self.content_hash(data), 'fetched_at': time.time()}, broadcast_id)
     
-    def fetch_audio_data(self, broadcast_id: str = "640", date: str = "20240724", force_update: bool = False) -> Dict[str, Any]:
+    def fetch_audio_data(self, broadcast_id: str = DEFAULT_BROADCAST_ID, date: str = "20240724", force_update: bool = False) -> Dict[str, Any]:
         """
         获取指定日期的音频数据，支持缓存机制
+        历史日期冻结后直接使用缓存；近期日期按间隔用条件请求（ETag/Last-Modified）
+        或内容哈希重新验证，内容未变化时不重写缓存
         
         Args:
             broadcast_id: 广播ID
@@ -107,56 +384,120 @@ class YuntinAudioAnalyzer:
         Returns:
             音频数据字典
         """
+        cached_data: Dict[str, Any] = {}
+        meta: Dict[str, Any] = {}
         # 如果不强制更新，先尝试从缓存加载
         if not force_update:
-            cached_data = self.load_cached_data(date)
+            cached_data = self.load_cached_data(date, broadcast_id)
             if cached_data:
-                return cached_data
+                meta = self.load_cache_meta(date, broadcast_id)
+                if not self.needs_revalidation(date, meta):
+                    return cached_data
         
         params = {
             'broadcastId': broadcast_id,
             'date': date
         }
+        headers = {}
+        if cached_data:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
         
         try:
-            print(f"正在获取 {date} 的音频数据...")
+            print(f"正在{'验证' if cached_data else '获取'} {broadcast_id}/{date} 的音频数据...")
             # 禁用SSL证书验证
-            response = self.session.get(self.base_url, params=params, timeout=30, verify=False)
+            response = self.session.get(self.base_url, params=params, headers=headers, timeout=30, verify=False)
+            if response.status_code == 304 and cached_data:
+                print(f"{broadcast_id}/{date} 未变化（304），沿用缓存")
+                meta['fetched_at'] = time.time()
+                self.save_cache_meta(date, meta, broadcast_id)
+                return cached_data
             response.raise_for_status()
             
             data = response.json()
+            new_meta = {
+                'sha256': self.content_hash(data),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+            }
+            if cached_data and new_meta['sha256'] == (meta.get('sha256') or self.content_hash(cached_data)):
+                print(f"{broadcast_id}/{date} 内容哈希未变化，沿用缓存")
+                self.save_cache_meta(date, new_meta, broadcast_id)
+                return cached_data
             print(f"成功获取数据，共 {len(data.get('data', []))} 条音频记录")
             
             # 保存到缓存
-            self.save_cached_data(date, data)
+            self.save_cached_data(date, data, broadcast_id, new_meta)
             
             return data
             
         except requests.exceptions.RequestException as e:
             print(f"请求失败: {e}")
-            return {}
+            # 重新验证失败时退回已有缓存
+            return cached_data
         except json.JSONDecodeError as e:
             print(f"JSON解析失败: {e}")
-            return {}
+            return cached_data
+        finally:
+            # 仅在实际请求网络后等待，命中缓存时不拖慢整体抓取
+            time.sleep(self.request_interval)
     
-    def analyze_audio_items(self, audio_data: Dict[str, Any], program_type: str = "那些年") -> List[Dict[str, Any]]:
+    def fetch_many(self, broadcast_ids: List[str], dates: List[str], force_update: bool = False, max_workers: int = 4) -> Dict[Tuple[str, str], Dict[str, Any]]:
         """
-        分析音频数据，筛选出指定类型的音频，并增加 release_date 字段
+        并发获取多个频道、多个日期的音频数据，共享同一缓存目录
+        
+        Args:
+            broadcast_ids: 广播ID列表
+            dates: 日期列表，格式为YYYYMMDD
+            force_update: 是否强制更新缓存
+            max_workers: 并发线程数
+            
+        Returns:
+            {(broadcast_id, date): 音频数据字典}
+        """
+        tasks = [(broadcast_id, date) for broadcast_id in broadcast_ids for date in dates]
+        results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(self.fetch_audio_data, broadcast_id, date, force_update): (broadcast_id, date)
+                for broadcast_id, date in tasks
+            }
+            for fut in as_completed(futures):
+                key = futures[fut]
+                try:
+                    results[key] = fut.result()
+                except Exception as e:
+                    print(f"获取 {key[0]}/{key[1]} 失败: {e}")
+                    results[key] = {}
+        return results
+    
+    def analyze_audio_items(self, audio_data: Dict[str, Any], program_type: str = "那些年", include_replay: bool = False) -> List[Dict[str, Any]]:
+        """
+        分析音频数据，按规范节目名筛选音频，并增加 release_date 字段
         Args:
             audio_data: 原始音频数据
-            program_type: 节目类型 ("那些年" 或 "财经阅读")
+            program_type: 节目类型，"全部"、"*" 或逗号分隔的节目名
+            include_replay: 是否保留重播版本
         Returns:
             筛选后的音频列表
         """
         if not audio_data or 'data' not in audio_data:
             return []
         
+        programs = parse_program_filter(program_type)
+        wanted = set(programs) if programs is not None else None
         audio_items = audio_data['data']
         filtered_items = []
         
         for item in audio_items:
             program_name = item.get('programName', '')
-            if program_name != program_type:
+            program_key, is_replay = self.program_index.add_item(item)
+            if not program_key or (is_replay and not include_replay):
+                continue
+            if wanted is not None and program_key not in wanted:
                 continue
             # 解析日期
             program_date = item.get('programDate')
@@ -172,6 +513,10 @@ class YuntinAudioAnalyzer:
             filtered_item = {
                 'id': item.get('id'),
                 'program_name': program_name,
+                'program_key': program_key,
+                'is_replay': is_replay,
+                'broadcast_id': item.get('broadcastId'),
+                'column_id': item.get('columnId'),
                 'release_date': release_date,
                 'play_url_low': item.get('playUrlLow'),
                 'play_url_high': item.get('playUrlHigh')
@@ -202,50 +547,48 @@ class YuntinAudioAnalyzer:
         except Exception as e:
             print(f"保存文件失败: {e}")
     
-    def run_analysis(self, dates: List[str] = None, output_file: str = "audio_output/yuntin_those_years_audio.json", program_type: str = "那些年", force_update: bool = False):
+    def run_analysis(self, dates: List[str] = None, output_file: str = "audio_output/yuntin_those_years_audio.json", program_type: str = "那些年", force_update: bool = False, broadcast_ids: List[str] = None, include_replay: bool = False, max_workers: int = 4):
         """
         运行完整的分析流程
         
         Args:
             dates: 要分析的日期列表，如果为None则使用默认日期
             output_file: 输出文件名
-            program_type: 节目类型 ("那些年"、"财经阅读" 或 "全部")
+            program_type: 节目类型，"全部"（那些年+财经阅读）、"*"（所有节目）或逗号分隔的节目名
             force_update: 是否强制更新缓存
+            broadcast_ids: 广播ID列表，默认仅 640
+            include_replay: 是否保留重播版本
+            max_workers: 并发抓取线程数
         """
         if dates is None:
             dates = ["20240724"]  # 默认日期
+        if not broadcast_ids:
+            broadcast_ids = [DEFAULT_BROADCAST_ID]
         
+        all_data = self.fetch_many(broadcast_ids, dates, force_update, max_workers)
         all_filtered_items = []
         
-        for date in dates:
-            print(f"\n=== 分析日期: {date} ===")
-            
-            # 获取音频数据
-            audio_data = self.fetch_audio_data(date=date, force_update=force_update)
-            
-            if audio_data:
-                # 分析音频项目
-                if program_type == "全部":
-                    items_those_years = self.analyze_audio_items(audio_data, "那些年")
-                    items_finance = self.analyze_audio_items(audio_data, "财经阅读")
-                    filtered_items = items_those_years + items_finance
-                    all_filtered_items.extend(filtered_items)
-                    print(f"日期 {date} 找到 {len(items_those_years)} 条《那些年》，{len(items_finance)} 条《财经阅读》，合计 {len(filtered_items)} 条")
-                    # 显示找到的音频标题
-                    for i, item in enumerate(filtered_items, 1):
-                        print(f"  {i}. {item['program_name']}")
-                else:
-                    filtered_items = self.analyze_audio_items(audio_data, program_type)
-                    all_filtered_items.extend(filtered_items)
-                    
-                    print(f"日期 {date} 找到 {len(filtered_items)} 条符合条件的音频")
-                    
-                    # 显示找到的音频标题
-                    for i, item in enumerate(filtered_items, 1):
-                        print(f"  {i}. {item['program_name']}")
-            
-            # 添加延迟避免请求过于频繁
-            time.sleep(1)
+        for broadcast_id in broadcast_ids:
+            for date in dates:
+                print(f"\n=== 分析频道 {broadcast_id} 日期: {date} ===")
+                audio_data = all_data.get((broadcast_id, date))
+                if not audio_data:
+                    continue
+                
+                filtered_items = self.analyze_audio_items(audio_data, program_type, include_replay)
+                all_filtered_items.extend(filtered_items)
+                
+                counts = defaultdict(int)
+                for item in filtered_items:
+                    counts[item['program_key']] += 1
+                detail = "，".join(f"{count} 条《{key}》" for key, count in sorted(counts.items()))
+                print(f"日期 {date} 找到 {len(filtered_items)} 条符合条件的音频" + (f"：{detail}" if detail else ""))
+                
+                # 显示找到的音频标题
+                for i, item in enumerate(filtered_items, 1):
+                    print(f"  {i}. {item['program_name']}")
+        
+        self.program_index.save()
         
         # 保存结果
         if all_filtered_items:
@@ -258,18 +601,23 @@ def main():
     parser = argparse.ArgumentParser(description='云听音频分析工具')
     parser.add_argument('--days', type=int, default=1, help='获取最近N天的数据，默认1=昨天')
     parser.add_argument('--output', type=str, default=None, help='输出文件名，未指定则默认 audio_output/<日期>.json')
-    parser.add_argument('--program', type=str, default='全部', choices=['那些年', '财经阅读', '全部'], help='节目类型，默认 全部')
+    parser.add_argument('--program', type=str, default='全部', help='节目类型：全部（那些年+财经阅读）、*（所有节目）或逗号分隔的节目名，默认 全部')
+    parser.add_argument('--broadcast-ids', type=str, default=DEFAULT_BROADCAST_ID, help=f'逗号分隔的广播ID列表，默认 {DEFAULT_BROADCAST_ID}')
+    parser.add_argument('--include-replay', action='store_true', help='保留重播版本')
+    parser.add_argument('--workers', type=int, default=4, help='并发抓取线程数，默认4')
     parser.add_argument('--force', action='store_true', help='强制更新缓存，重新请求所有数据')
 
     args = parser.parse_args()
 
     analyzer = YuntinAudioAnalyzer()
+    broadcast_ids = [b.strip() for b in args.broadcast_ids.split(',') if b.strip()]
     
     # 生成日期列表：统一用 generate_date_list，从昨天开始往前数最近 N 天
     dates_to_analyze = analyzer.generate_date_list(args.days)
     
     print(f"开始分析云听{args.program}音频，获取最近 {args.days} 天的数据...")
     print(f"分析日期: {', '.join(dates_to_analyze)}")
+    print(f"频道: {', '.join(broadcast_ids)}")
     if args.force:
         print("强制更新模式：将重新请求所有数据")
     
@@ -283,7 +631,7 @@ def main():
             # 多天时以起止日期命名：最早-最晚
             output_file = f"audio_output/{dates_to_analyze[-1]}-{dates_to_analyze[0]}.json"
     
-    analyzer.run_analysis(dates_to_analyze, output_file, args.program, args.force)
+    analyzer.run_analysis(dates_to_analyze, output_file, args.program, args.force, broadcast_ids, args.include_replay, args.workers)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
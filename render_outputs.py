@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量渲染脚本
+从 mindmap_output/*_transcribe_core.json 为每期节目生成高亮JSON与脑图HTML，并生成节目索引页
+- 增量：以「节目内容 + 模板 + 渲染器版本」的内容哈希判断是否需要重建
+- 并行：需要重建的节目分发到进程池渲染
+"""
+
+import os
+import re
+import glob
+import json
+import html
+import hashlib
+import argparse
+from string import Template
+from typing import List, Dict, Any, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 渲染逻辑变化时递增，使已有输出全部失效
+RENDERER_VERSION = "1"
+TEMPLATE_DIR = "templates"
+MINDMAP_TEMPLATE = os.path.join(TEMPLATE_DIR, "mindmap.html")
+INDEX_TEMPLATE = os.path.join(TEMPLATE_DIR, "program_index.html")
+MANIFEST_NAME = ".render_manifest.json"
+
+SENTENCE_DELIMITER = re.compile(r"[。！？!.?\n]+")
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def safe_name(name: str) -> str:
+    """
+    清理文件名中的路径分隔符与括号
+    """
+    return re.sub(r"[\\/:*?\"<>|()（）\s]+", "", name or "") or "未命名"
+
+
+def clip(text: str, limit: int) -> str:
+    """
+    截断过长语句（Whisper 中文转写常缺少标点，一句可能很长）
+    """
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def load_episodes(input_glob: str) -> List[Dict[str, Any]]:
+    """
+    读取所有转写提炼结果，按 (节目, 日期, id) 去重；重叠日期区间中较新的文件优先
+    """
+    episodes: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for path in sorted(glob.glob(input_glob), key=os.path.getmtime):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"读取失败 {path}: {e}")
+            continue
+        for item in data.get("items", []):
+            program_key = item.get("program_key") or item.get("program_name")
+            release_date = item.get("release_date")
+            if not program_key or not release_date:
+                continue
+            episodes[(program_key, release_date, str(item.get("id", "")))] = item
+    return [episodes[k] for k in sorted(episodes)]
+
+
+def episode_paths(output_dir: str, item: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    返回 (高亮JSON路径, 脑图HTML路径)
+    """
+    program_key = item.get("program_key") or item.get("program_name")
+    stem = f"{item['release_date']}_{safe_name(str(item.get('id', '')))}"
+    program_dir = os.path.join(output_dir, safe_name(program_key))
+    return (os.path.join(program_dir, f"{stem}_highlight.json"),
+            os.path.join(program_dir, f"{stem}_mindmap.html"))
+
+
+def build_highlight(item: Dict[str, Any], max_branches: int = 6, details_per_branch: int = 3) -> Dict[str, Any]:
+    """
+    由关键词与摘要句构建高亮结构（字段与 audio2txt2comic 中的手工样例一致）
+    每个关键词一个分支，分支下列出原文中包含该关键词的语句
+    """
+    program = item.get("program_key") or item.get("program_name", "")
+    keywords: List[str] = item.get("keywords", [])
+    summary: List[str] = item.get("summary", [])
+    sentences = [s.strip() for s in SENTENCE_DELIMITER.split(item.get("transcript_text", "")) if len(s.strip()) >= 6]
+
+    branches = []
+    for keyword in keywords[:max_branches]:
+        summary_hits = [s for s in summary if keyword in s]
+        text_hits = [s for s in sentences if keyword in s and s not in summary_hits]
+        children = []
+        if summary_hits:
+            children.append({"topic": "摘要", "details": [clip(s, 80) for s in summary_hits[:details_per_branch]]})
+        if text_hits:
+            children.append({"topic": "原文摘录", "details": [clip(s, 80) for s in text_hits[:details_per_branch]]})
+        if children:
+            branches.append({"topic": keyword, "children": children})
+
+    main_topic = clip(summary[0], 40) if summary else "、".join(keywords[:3])
+    return {
+        "title": f"{program} {item.get('release_date', '')}",
+        "date": item.get("release_date", ""),
+        "program": program,
+        "main_topic": main_topic,
+        "audio_source": os.path.basename(item.get("audio_path", "")),
+        "transcription_tool": "OpenAI Whisper",
+        "branches": branches,
+        "key_points": {"关键词": "、".join(keywords)} if keywords else {},
+        "summary": "".join(clip(s, 120) + "。" for s in summary),
+    }
+
+
+def render_mindmap_html(highlight: Dict[str, Any], template_text: str) -> str:
+    esc = html.escape
+    branch_blocks = []
+    for branch in highlight["branches"]:
+        child_blocks = []
+        for child in branch["children"]:
+            details = "\n".join(f"                                    <li>{esc(d)}</li>" for d in child["details"])
+            child_blocks.append(
+                "                            <div class=\"child\">\n"
+                f"                                <div class=\"child-title\">{esc(child['topic'])}</div>\n"
+                "                                <ul class=\"details\">\n"
+                f"{details}\n"
+                "                                </ul>\n"
+                "                            </div>"
+            )
+        branch_blocks.append(
+            "                    <div class=\"branch animation\">\n"
+            f"                        <div class=\"branch-title\">{esc(branch['topic'])}</div>\n"
+            "                        <div class=\"children\">\n"
+            + "\n".join(child_blocks) + "\n"
+            "                        </div>\n"
+            "                    </div>"
+        )
+    key_points = "\n".join(
+        "                        <div class=\"key-point\">\n"
+        f"                            <strong>{esc(k)}</strong>\n"
+        f"                            {esc(v)}\n"
+        "                        </div>"
+        for k, v in highlight["key_points"].items()
+    )
+    return Template(template_text).safe_substitute(
+        title=esc(highlight["title"]),
+        subtitle=esc(highlight["audio_source"]),
+        date=esc(highlight["date"]),
+        program=esc(highlight["program"]),
+        tool=esc(highlight["transcription_tool"]),
+        main_topic=esc(highlight["main_topic"]),
+        branches="\n\n".join(branch_blocks),
+        key_points=key_points,
+        summary=esc(highlight["summary"]),
+    )
+
+
+def write_text(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _worker_render(args: Tuple[Dict[str, Any], str, str, str]) -> Dict[str, Any]:
+    item, template_text, highlight_path, mindmap_path = args
+    highlight = build_highlight(item)
+    write_text(highlight_path, json.dumps(highlight, ensure_ascii=False, indent=2))
+    write_text(mindmap_path, render_mindmap_html(highlight, template_text))
+    return {"main_topic": highlight["main_topic"]}
+
+
+def render_index_html(title: str, entries: List[Dict[str, Any]], template_text: str, meta: str) -> str:
+    esc = html.escape
+    rows = "\n".join(
+        "            <li>\n"
+        f"                <a href=\"{esc(e['href'])}\">{esc(e['label'])}</a>\n"
+        f"                <div class=\"detail\">{esc(e.get('detail', ''))}</div>\n"
+        "            </li>"
+        for e in entries
+    )
+    return Template(template_text).safe_substitute(title=esc(title), meta=esc(meta), entries=rows)
+
+
+def load_manifest(output_dir: str) -> Dict[str, str]:
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取渲染清单失败: {e}")
+    return {}
+
+
+def save_manifest(output_dir: str, manifest: Dict[str, str]) -> None:
+    write_text(os.path.join(output_dir, MANIFEST_NAME), json.dumps(dict(sorted(manifest.items())), ensure_ascii=False, indent=2))
+
+
+def render_all(input_glob: str = "mindmap_output/*_transcribe_core.json", output_dir: str = "render_output",
+               max_workers: int = 4, force: bool = False) -> Dict[str, int]:
+    """
+    渲染全部节目与索引页，只重建内容哈希变化的输出
+
+    Args:
+        input_glob: 转写提炼结果文件通配符
+        output_dir: 输出目录
+        max_workers: 并发进程数
+        force: 忽略清单，全部重建
+
+    Returns:
+        统计信息
+    """
+    mindmap_template = read_text(MINDMAP_TEMPLATE)
+    index_template = read_text(INDEX_TEMPLATE)
+    mindmap_template_hash = sha256_text(mindmap_template)
+    index_template_hash = sha256_text(index_template)
+
+    old_manifest = {} if force else load_manifest(output_dir)
+    manifest: Dict[str, str] = {}
+    stats = {"episodes": 0, "rendered": 0, "skipped": 0, "failed": 0, "indexes": 0, "removed": 0}
+
+    episodes = load_episodes(input_glob)
+    # 本次输入中仍存在的输出；只清理不在其中的旧输出，渲染失败的不算过期
+    live_keys = set()
+    tasks: List[Tuple[Dict[str, Any], str, str, str]] = []
+    by_program: Dict[str, List[Dict[str, Any]]] = {}
+    for item in episodes:
+        stats["episodes"] += 1
+        highlight_path, mindmap_path = episode_paths(output_dir, item)
+        key = os.path.relpath(mindmap_path, output_dir)
+        digest = sha256_text("\n".join([
+            RENDERER_VERSION,
+            mindmap_template_hash,
+            json.dumps(item, ensure_ascii=False, sort_keys=True),
+        ]))
+        manifest[key] = digest
+        live_keys.add(key)
+        program_key = item.get("program_key") or item.get("program_name")
+        by_program.setdefault(program_key, []).append({"item": item, "mindmap_path": mindmap_path})
+        if old_manifest.get(key) == digest and os.path.exists(highlight_path) and os.path.exists(mindmap_path):
+            stats["skipped"] += 1
+            continue
+        tasks.append((item, mindmap_template, highlight_path, mindmap_path))
+
+    if tasks:
+        print(f"并发渲染开始: {len(tasks)} 期节目, workers={max_workers}")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(_worker_render, t): t for t in tasks}
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                    stats["rendered"] += 1
+                except Exception as e:
+                    # 渲染失败时保留上次成功的哈希（没有则不记录），下次重试且不会被当作过期输出清理
+                    key = os.path.relpath(futures[fut][3], output_dir)
+                    if key in old_manifest:
+                        manifest[key] = old_manifest[key]
+                    else:
+                        manifest.pop(key, None)
+                    stats["failed"] += 1
+                    print(f"渲染失败 {futures[fut][3]}: {e}")
+
+    # 节目索引页：按日期倒序列出，内容为条目元信息的哈希
+    # 只列出脑图文件确实存在的条目（首次渲染就失败的不出现在索引中，修复后自动补上）
+    program_entries = []
+    for program_key, rows in sorted(by_program.items()):
+        rows = [r for r in rows if os.path.exists(r["mindmap_path"])]
+        if not rows:
+            continue
+        program_dir = os.path.join(output_dir, safe_name(program_key))
+        index_path = os.path.join(program_dir, "index.html")
+        entries = [{
+            "href": os.path.basename(r["mindmap_path"]),
+            "label": f"{r['item']['release_date']} {r['item'].get('program_name', program_key)}",
+            "detail": "、".join(r["item"].get("keywords", [])[:5]),
+        } for r in sorted(rows, key=lambda r: r["item"]["release_date"], reverse=True)]
+        program_entries.append({
+            "href": f"{safe_name(program_key)}/index.html",
+            "label": program_key,
+            "detail": f"{len(rows)} 期，最新 {entries[0]['label'].split(' ')[0]}",
+        })
+        stats["indexes"] += _render_index_if_changed(
+            index_path, program_key, entries, f"共 {len(entries)} 期",
+            index_template, index_template_hash, output_dir, old_manifest, manifest)
+
+    stats["indexes"] += _render_index_if_changed(
+        os.path.join(output_dir, "index.html"), "节目总览", program_entries, f"共 {len(program_entries)} 个节目",
+        index_template, index_template_hash, output_dir, old_manifest, manifest)
+
+    live_keys.update(k for k in manifest if k.endswith("index.html"))
+
+    # 清理输入中已不存在的节目输出
+    for key in set(old_manifest) - live_keys:
+        stale = [os.path.join(output_dir, key)]
+        if key.endswith("_mindmap.html"):
+            stale.append(os.path.join(output_dir, key[:-len("_mindmap.html")] + "_highlight.json"))
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+                stats["removed"] += 1
+
+    save_manifest(output_dir, manifest)
+    print(f"渲染完成: 共 {stats['episodes']} 期，重建 {stats['rendered']}，跳过 {stats['skipped']}，失败 {stats['failed']}，"
+          f"索引页更新 {stats['indexes']}，清理 {stats['removed']} 个过期文件")
+    return stats
+
+
+def _render_index_if_changed(index_path: str, title: str, entries: List[Dict[str, Any]], meta: str,
+                             template_text: str, template_hash: str, output_dir: str,
+                             old_manifest: Dict[str, str], manifest: Dict[str, str]) -> int:
+    key = os.path.relpath(index_path, output_dir)
+    digest = sha256_text("\n".join([
+        RENDERER_VERSION,
+        template_hash,
+        json.dumps([title, meta, entries], ensure_ascii=False, sort_keys=True),
+    ]))
+    manifest[key] = digest
+    if old_manifest.get(key) == digest and os.path.exists(index_path):
+        return 0
+    write_text(index_path, render_index_html(title, entries, template_text, meta))
+    return 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批量渲染高亮JSON、脑图HTML与节目索引页（增量、并行）")
+    parser.add_argument("--input", type=str, default="mindmap_output/*_transcribe_core.json", help="转写提炼结果通配符")
+    parser.add_argument("--output", type=str, default="render_output", help="输出目录，默认 render_output")
+    parser.add_argument("--workers", type=int, default=4, help="并发进程数，默认4")
+    parser.add_argument("--force", action="store_true", help="忽略渲染清单，全部重建")
+    args = parser.parse_args()
+
+    render_all(args.input, args.output, args.workers, args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,26 +3,30 @@
 """
 全流程流水线脚本
 步骤：
-1) 获取云听JSON（最近N天，从昨天起往前），支持节目：那些年 / 财经阅读 / 全部
-2) 根据JSON下载音频到 raw_audio/
-3) Whisper 将音频转文字
+1) 获取云听JSON（最近N天，从昨天起往前），支持多频道、任意节目（全部=那些年+财经阅读，*=所有节目）
+2) 根据JSON下载音频到 raw_audio/（adaptive 模式只下载低码率）
+3) Whisper 将音频转文字（adaptive 模式对低置信度片段拉取高码率局部重转）
 4) 从文字中提取核心关键词与摘要句
+5) （可选 --render）增量渲染高亮JSON、脑图HTML与节目索引页
 
 复用：
 - fetch_yuntin_audio_json.py → YuntinAudioAnalyzer
 - download_raw_audio.py → download_from_json / 命名约定
 - audio2txt2comic/whisper_example.py → simple_transcribe
+- render_outputs.py → render_all
+- adaptive_quality.py → refine_with_high_quality
 """
 
 import os
 import json
 import argparse
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from fetch_yuntin_audio_json import YuntinAudioAnalyzer
-from download_raw_audio import download_from_json, get_audio_filename
+from fetch_yuntin_audio_json import YuntinAudioAnalyzer, DEFAULT_BROADCAST_ID
+from download_raw_audio import download_from_json, RawAudioStore
 from audio2txt2comic.whisper_example import simple_transcribe
+from render_outputs import render_all
 
 
 def ensure_dir_exists(directory_path: str) -> None:
@@ -32,11 +36,21 @@ def ensure_dir_exists(directory_path: str) -> None:
 
 def build_output_json_path(dates: List[str], program: str) -> str:
     ensure_dir_exists("audio_output")
+    program = program_label(program)
     if len(dates) == 1:
         return f"audio_output/{dates[0]}_{program}.json"
     return f"audio_output/{dates[-1]}-{dates[0]}_{program}.json"
 
 
+def program_label(program: str) -> str:
+    """
+    将节目筛选参数转为可用于文件名的标签
+    """
+    if program == "*":
+        return "所有"
+    return program.replace(",", "+")
+
+
 def extract_keywords_and_summary(text: str, top_k: int = 10, summary_sentences: int = 5) -> Dict[str, Any]:
     """
     轻量中文关键词与摘要提取（无第三方依赖）
@@ -106,10 +120,12 @@ def load_audio_items_from_json(json_path: str) -> List[Dict[str, Any]]:
     return items
 
 
-def _worker_transcribe(args: Tuple[Dict[str, Any], str, str]) -> Dict[str, Any]:
-    item, quality, model_name = args
-    from download_raw_audio import get_audio_filename
+def _worker_transcribe(args: Tuple[Dict[str, Any], str, str, bool]) -> Dict[str, Any]:
+    item, quality, model_name, decode_guard = args
+    from download_raw_audio import get_audio_path
     from audio2txt2comic.whisper_example import simple_transcribe
+    from audio2txt2comic.decode_guard import guarded_transcribe
+    from adaptive_quality import refine_with_high_quality
     import os
 
     program_name = item.get("program_name")
@@ -117,12 +133,21 @@ def _worker_transcribe(args: Tuple[Dict[str, Any], str, str]) -> Dict[str, Any]:
     if not program_name or not release_date:
         return {}
 
-    filename = get_audio_filename(program_name, release_date, quality)
-    audio_path = os.path.join("raw_audio", filename)
+    adaptive = quality == "adaptive"
+    audio_path = get_audio_path(item, "low" if adaptive else quality)
     if not os.path.exists(audio_path):
         return {}
 
-    whisper_result = simple_transcribe(audio_path, model_name=model_name)
+    if decode_guard:
+        whisper_result = guarded_transcribe(audio_path, model_name=model_name)
+    else:
+        whisper_result = simple_transcribe(audio_path, model_name=model_name)
+    if adaptive:
+        try:
+            whisper_result = refine_with_high_quality(whisper_result, audio_path, item.get("play_url_high"), model_name=model_name)
+        except Exception as e:
+            # 高码率重转出现意外错误时保留已完成的低码率转写，不丢失整期节目
+            print(f"自适应音质失败，保留低码率结果 {audio_path}: {e}")
     text: str = whisper_result.get("text", "")
 
     # 轻量提炼（重复实现以避免子进程依赖父进程闭包）
@@ -151,29 +176,46 @@ def _worker_transcribe(args: Tuple[Dict[str, Any], str, str]) -> Dict[str, Any]:
     return {
         "id": item.get("id"),
         "program_name": program_name,
+        "program_key": item.get("program_key") or program_name,
         "release_date": release_date,
         "audio_path": audio_path,
+        "audio_quality": "low" if adaptive else quality,
         "transcript_text": text,
         "keywords": keywords,
         "summary": summary,
+        "guard_stats": whisper_result.get("guard_stats"),
+        "adaptive_stats": whisper_result.get("adaptive_stats"),
     }
 
 
-def transcribe_and_extract(items: List[Dict[str, Any]], quality: str = "high", limit: int = 0, model_name: str = "tiny", max_workers: int = 2) -> List[Dict[str, Any]]:
+def transcribe_and_extract(items: List[Dict[str, Any]], quality: str = "high", limit: int = 0, model_name: str = "tiny", max_workers: int = 2, decode_guard: bool = False, store: Optional[RawAudioStore] = None) -> List[Dict[str, Any]]:
     """
     对已下载音频按既定命名规则做转写与提炼。
-    limit>0 时仅处理前 limit 条。
+    limit>0 时仅处理前 limit 条；decode_guard 时使用带解码守卫的转写。
+    音频已被淘汰的条目直接复用 store 中保存的转写结果。
     """
     results: List[Dict[str, Any]] = []
-    tasks: List[Tuple[Dict[str, Any], str, str]] = []
+    tasks: List[Tuple[Dict[str, Any], str, str, bool]] = []
+    audio_quality = "low" if quality == "adaptive" else quality
+    reused = 0
     count = 0
     for it in items:
         if limit > 0 and count >= limit:
             break
-        tasks.append((it, quality, model_name))
         count += 1
-
+        item_id = str(it.get("id") or "")
+        if store is not None and item_id and store.is_evicted_with_result(item_id, audio_quality):
+            prior = store.load_result(item_id, audio_quality)
+            if prior:
+                results.append(prior)
+                reused += 1
+                continue
+        tasks.append((it, quality, model_name, decode_guard))
+
+    if reused:
+        print(f"复用已淘汰音频的转写结果: {reused} 条")
     if not tasks:
+        results.sort(key=lambda x: (x.get("release_date", ""), x.get("program_name", "")))
         return results
 
     print(f"并发转写开始: {len(tasks)} 个任务, workers={max_workers}, model={model_name}")
@@ -189,46 +231,78 @@ def transcribe_and_extract(items: List[Dict[str, Any]], quality: str = "high", l
 
     # 按日期、节目名排序，稳定输出
     results.sort(key=lambda x: (x.get("release_date", ""), x.get("program_name", "")))
+
+    guarded = [r["guard_stats"] for r in results if r.get("guard_stats")]
+    if guarded:
+        saved = sum(g["saved_passes"] for g in guarded)
+        passes = sum(g["decode_passes"] for g in guarded)
+        print(f"解码守卫: {len(guarded)} 期节目共解码 {passes} 次，估计节省 {saved} 次")
+
+    adaptive = [r["adaptive_stats"] for r in results if r.get("adaptive_stats")]
+    if adaptive:
+        saved_bytes = sum(a.get("saved_bytes", 0) for a in adaptive)
+        replaced = sum(a.get("replaced_segments", 0) for a in adaptive)
+        print(f"自适应音质: {len(adaptive)} 期节目共替换 {replaced} 个低置信度片段，相比整段高码率节省 {saved_bytes} 字节")
     return results
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="云听全流程流水线：JSON→音频→转写→提炼")
     parser.add_argument("--days", type=int, default=1, help="最近N天（从昨天起向前N天），默认1")
-    parser.add_argument("--program", type=str, default="全部", choices=["那些年", "财经阅读", "全部"], help="节目类型，默认全部")
-    parser.add_argument("--quality", type=str, default="high", choices=["high", "low"], help="下载与转写所用音质，默认high")
+    parser.add_argument("--program", type=str, default="全部", help="节目类型：全部（那些年+财经阅读）、*（所有节目）或逗号分隔的节目名，默认全部")
+    parser.add_argument("--broadcast-ids", type=str, default=DEFAULT_BROADCAST_ID, help=f"逗号分隔的广播ID列表，默认{DEFAULT_BROADCAST_ID}")
+    parser.add_argument("--include-replay", action="store_true", help="保留重播版本")
+    parser.add_argument("--quality", type=str, default="high", choices=["high", "low", "adaptive"], help="下载与转写所用音质，默认high；adaptive 先转写低码率，再只对低置信度片段拉取高码率局部重转")
     parser.add_argument("--force", action="store_true", help="强制更新获取JSON，忽略缓存")
     parser.add_argument("--limit", type=int, default=0, help="最多处理多少条音频，0为不限制")
     parser.add_argument("--whisper-model", type=str, default="tiny", choices=["tiny", "base", "small", "medium", "large"], help="Whisper模型，默认tiny")
     parser.add_argument("--workers", type=int, default=2, help="并发进程数，默认2")
+    parser.add_argument("--raw-audio-max-gb", type=float, default=0, help="raw_audio/ 总大小上限（GB），转写后淘汰已转写的音频；0 表示不限制")
+    parser.add_argument("--render", action="store_true", help="转写后增量渲染高亮JSON、脑图HTML与节目索引页到 render_output/")
+    parser.add_argument("--decode-guard", action="store_true", help="启用解码守卫：提前截断重复/低置信度窗口，限制温度回退")
 
     args = parser.parse_args()
 
     analyzer = YuntinAudioAnalyzer()
+    broadcast_ids = [b.strip() for b in args.broadcast_ids.split(",") if b.strip()]
     dates = analyzer.generate_date_list(args.days)
     json_output_path = build_output_json_path(dates, args.program)
 
     print(f"步骤1/4 获取JSON → {json_output_path}")
-    analyzer.run_analysis(dates, json_output_path, args.program, args.force)
+    analyzer.run_analysis(dates, json_output_path, args.program, args.force, broadcast_ids, args.include_replay)
 
     print("步骤2/4 下载音频到 raw_audio/")
-    download_from_json(json_output_path, args.quality)
+    download_from_json(json_output_path, "low" if args.quality == "adaptive" else args.quality)
+    max_bytes = int(args.raw_audio_max_gb * 1024 ** 3)
 
     print("步骤3/4 Whisper转写")
     audio_items = load_audio_items_from_json(json_output_path)
-    transcribed = transcribe_and_extract(audio_items, args.quality, args.limit, model_name=args.whisper_model, max_workers=args.workers)
+    store = RawAudioStore()
+    transcribed = transcribe_and_extract(audio_items, args.quality, args.limit, model_name=args.whisper_model, max_workers=args.workers, decode_guard=args.decode_guard, store=store)
+
+    # 记录转写状态并保存结果，超出大小上限时淘汰已转写的音频
+    for res in transcribed:
+        store.mark_transcribed(str(res.get("id")), res.get("audio_quality", args.quality), res)
+    if max_bytes > 0:
+        store.enforce_retention(max_bytes)
+    store.save()
 
     print("步骤4/4 核心提炼与保存")
     ensure_dir_exists("mindmap_output")
+    label = program_label(args.program)
     if len(dates) == 1:
-        result_path = f"mindmap_output/{dates[0]}_{args.program}_transcribe_core.json"
+        result_path = f"mindmap_output/{dates[0]}_{label}_transcribe_core.json"
     else:
-        result_path = f"mindmap_output/{dates[-1]}-{dates[0]}_{args.program}_transcribe_core.json"
+        result_path = f"mindmap_output/{dates[-1]}-{dates[0]}_{label}_transcribe_core.json"
 
     with open(result_path, "w", encoding="utf-8") as f:
         json.dump({"items": transcribed}, f, ensure_ascii=False, indent=2)
     print(f"已保存提炼结果: {result_path}")
 
+    if args.render:
+        print("步骤5 渲染高亮与脑图")
+        render_all(max_workers=args.workers)
+
 
 if __name__ == "__main__":
     main()